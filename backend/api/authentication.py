@@ -0,0 +1,154 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+TOKEN_KEY = 'auth:token:{}'
+
+
+class TokenUserCache:
+    """Кэш токенов с пользователями для CachedTokenAuthentication.
+
+    Первый уровень - LRU в памяти процесса на MAX_SIZE
+    токенов со сроком жизни TIMEOUT секунд. Второй,
+    необязательный, - алиас из CACHES (ALIAS), общий для
+    всех процессов. Сигналы из api.signals сбрасывают
+    токен при выходе, смене пароля и деактивации.
+    Другие процессы узнают об этом только из общего кэша,
+    поэтому их LRU может продержать токен ещё до TIMEOUT
+    секунд - срок стоит держать коротким. Без общего кэша
+    при WORKERS > 1 отозванный токен жил бы в чужих LRU,
+    поэтому кэш выключается (см. enabled и api.checks).
+
+    Наружу отдаются копии, чтобы запросы не делили
+    один объект пользователя.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def options(self):
+        return getattr(settings, 'TOKEN_AUTH_CACHE', {})
+
+    @property
+    def enabled(self):
+        if self.options.get('WORKERS', 1) > 1 and self.shared_cache is None:
+            return False
+        return self.options.get('ENABLED', True)
+
+    @property
+    def timeout(self):
+        return self.options.get('TIMEOUT', 60)
+
+    @property
+    def shared_cache(self):
+        alias = self.options.get('ALIAS')
+        if not alias or isinstance(caches[alias], LocMemCache):
+            return None
+        return caches[alias]
+
+    def copy(self, token):
+        token = copy.copy(token)
+        token.user = copy.copy(token.user)
+        return token
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self.copy(entry[0])
+            self._entries.pop(key, None)
+        shared_cache = self.shared_cache
+        token = None
+        if shared_cache is not None:
+            token = shared_cache.get(TOKEN_KEY.format(key))
+        with self._lock:
+            if token is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self.set_local(key, token)
+        return self.copy(token)
+
+    def set(self, key, token):
+        token = self.copy(token)
+        self.set_local(key, token)
+        shared_cache = self.shared_cache
+        if shared_cache is not None:
+            shared_cache.set(TOKEN_KEY.format(key), token, self.timeout)
+
+    def set_local(self, key, token):
+        with self._lock:
+            self._entries[key] = (token, time.monotonic() + self.timeout)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.options.get('MAX_SIZE', 1024):
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        shared_cache = self.shared_cache
+        if shared_cache is not None and keys:
+            shared_cache.delete_many([TOKEN_KEY.format(key) for key in keys])
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            keys = {
+                key for key, (token, _) in self._entries.items()
+                if token.user_id == user_id
+            }
+        keys.update(
+            Token.objects.filter(
+                user_id=user_id,
+            ).values_list('key', flat=True),
+        )
+        self.invalidate(*keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+            }
+
+
+token_user_cache = TokenUserCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication с кэшем токенов token_user_cache.
+
+    Совпадающий токен не ходит в базу: запрос Token + User
+    выполняется только при промахе кэша.
+    """
+
+    def authenticate_credentials(self, key):
+        if not token_user_cache.enabled:
+            return super().authenticate_credentials(key)
+        token = token_user_cache.get(key)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            token_user_cache.set(key, token)
+            return user, token
+        return token.user, token
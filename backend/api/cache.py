@@ -0,0 +1,130 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.http import urlencode
+
+GENERATION_KEY = 'recipes:list:gen:{}'
+PAGE_KEY = 'recipes:list:page:{}:{}:{}:{}'
+
+COUNTERS = (
+    ('hits', 'foodgram_recipe_list_cache_hits_total',
+     'Попадания в кэш списка рецептов.'),
+    ('misses', 'foodgram_recipe_list_cache_misses_total',
+     'Промахи кэша списка рецептов.'),
+)
+
+
+class RecipeListCache:
+    """Кэш отрендеренных страниц списка рецептов для анонимов.
+
+    Ключ страницы строится по нормализованной строке запроса,
+    виду ответа (пагинатор и режим: курсор или страницы,
+    ведь пустой ?cursor= меняет форму ответа) и поколениям
+    зависимостей: всего списка ('all'),
+    автора ('author:<id>') или тегов фильтра ('tag:<slug>'),
+    а также общего поколения 'global' (теги, ингредиенты,
+    имена авторов). Сигналы увеличивают только поколения,
+    затронутые изменённым рецептом, остальные страницы
+    остаются в кэше.
+
+    Бэкенд - любой алиас из CACHES, по умолчанию locmem.
+    Счётчики попаданий и промахов ведутся в процессе и
+    отдаются в MetricsView (render_metrics).
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def options(self):
+        return getattr(settings, 'RECIPE_LIST_CACHE', {})
+
+    @property
+    def enabled(self):
+        return self.options.get('ENABLED', True)
+
+    @property
+    def cache(self):
+        return caches[self.options.get('ALIAS', 'default')]
+
+    @property
+    def timeout(self):
+        return self.options.get('TIMEOUT', 60)
+
+    def normalize_query(self, query_params):
+        return urlencode(sorted(
+            (key, value)
+            for key in query_params
+            for value in query_params.getlist(key)
+            if value != ''
+        ))
+
+    def get_dependencies(self, query_params):
+        author = query_params.get('author')
+        if author:
+            return [f'author:{author}']
+        tags = sorted(set(query_params.getlist('tags')))
+        if tags:
+            return [f'tag:{slug}' for slug in tags]
+        return ['all']
+
+    def get_generations(self, names):
+        keys = [GENERATION_KEY.format(name) for name in names]
+        generations = self.cache.get_many(keys)
+        for key in keys:
+            if key not in generations:
+                # Начинаем со времени, чтобы после вытеснения
+                # счётчика не совпасть со старыми ключами страниц.
+                self.cache.add(key, time.time_ns(), None)
+                generations[key] = self.cache.get(key)
+        return [str(generations[key]) for key in keys]
+
+    def bump(self, *names):
+        for name in set(names):
+            key = GENERATION_KEY.format(name)
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                self.cache.add(key, time.time_ns(), None)
+
+    def get_key(self, request, variant=''):
+        query_params = request.query_params
+        names = ['global'] + self.get_dependencies(query_params)
+        return PAGE_KEY.format(
+            request.get_host(),
+            variant,
+            ':'.join(self.get_generations(names)),
+            self.normalize_query(query_params),
+        )
+
+    def get(self, key):
+        content = self.cache.get(key)
+        with self._lock:
+            if content is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return content
+
+    def set(self, key, content):
+        self.cache.set(key, content, self.timeout)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def render_metrics(self):
+        stats = self.stats()
+        lines = []
+        for key, metric, description in COUNTERS:
+            lines.append(f'# HELP {metric} {description}')
+            lines.append(f'# TYPE {metric} counter')
+            lines.append(f'{metric} {stats[key]}')
+        return '\n'.join(lines) + '\n'
+
+
+recipe_list_cache = RecipeListCache()
@@ -0,0 +1,109 @@
+import gzip
+import hashlib
+import io
+import threading
+
+from api.renderers import ORJSONRenderer
+from api.serializers import IngredientSerializer
+from recipes.models import DataVersion, Ingredient
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def parse_accept_encoding(header):
+    """Кодировки из Accept-Encoding с ненулевым q."""
+    encodings = set()
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        name, _, value = params.strip().partition('=')
+        if name.strip() == 'q':
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        if coding and quality > 0:
+            encodings.add(coding.strip().lower())
+    return encodings
+
+
+def gzip_compress(content):
+    """gzip с нулевым mtime: одинаковые байты на каждую сборку.
+
+    gzip.compress принимает mtime только с Python 3.8.
+    """
+    buffer = io.BytesIO()
+    with gzip.GzipFile(
+        fileobj=buffer,
+        mode='wb',
+        compresslevel=9,
+        mtime=0,
+    ) as file:
+        file.write(content)
+    return buffer.getvalue()
+
+
+class IngredientCatalogSnapshot:
+    """Снимок полного каталога ингредиентов.
+
+    JSON рендерится один раз на версию 'ingredients' из
+    DataVersion и хранится в памяти вместе со сжатыми
+    gzip и brotli (если установлен пакет brotli) вариантами.
+    У каждого варианта свой сильный ETag.
+    """
+
+    def __init__(self):
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def get_version(self):
+        version, _ = DataVersion.get_versions(
+            ['ingredients'],
+        ).get('ingredients', (0, None))
+        return version
+
+    def render(self):
+        return ORJSONRenderer().render(
+            IngredientSerializer(
+                Ingredient.objects.all(),
+                many=True,
+            ).data,
+        )
+
+    def build(self, version):
+        content = self.render()
+        digest = hashlib.sha1(content).hexdigest()
+        variants = {None: (content, f'"{digest}"')}
+        variants['gzip'] = (gzip_compress(content), f'"{digest}-gzip"')
+        if brotli is not None:
+            variants['br'] = (brotli.compress(content), f'"{digest}-br"')
+        return version, variants
+
+    def get_variants(self):
+        version = self.get_version()
+        snapshot = self._snapshot
+        if snapshot is None or snapshot[0] != version:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or snapshot[0] != version:
+                    snapshot = self.build(version)
+                    self._snapshot = snapshot
+        return snapshot[1]
+
+    def clear(self):
+        self._snapshot = None
+
+    def get(self, accept_encoding):
+        """Возвращает (кодировка, байты, ETag) под Accept-Encoding."""
+        variants = self.get_variants()
+        accepted = parse_accept_encoding(accept_encoding)
+        for encoding in ('br', 'gzip'):
+            if encoding in accepted and encoding in variants:
+                return (encoding,) + variants[encoding]
+        return (None,) + variants[None]
+
+
+ingredient_catalog = IngredientCatalogSnapshot()
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+from api.authentication import token_user_cache
+
+
+@register()
+def check_token_auth_cache(app_configs, **kwargs):
+    """Кэш токенов при нескольких воркерах требует общий ALIAS.
+
+    Без него token_user_cache выключается, и каждый запрос
+    снова читает токен из базы.
+    """
+    options = getattr(settings, 'TOKEN_AUTH_CACHE', {})
+    if (
+        not options.get('ENABLED', True)
+        or options.get('WORKERS', 1) <= 1
+        or token_user_cache.shared_cache is not None
+    ):
+        return []
+    return [
+        Warning(
+            'TOKEN_AUTH_CACHE выключен: при нескольких воркерах '
+            'нужен общий кэш.',
+            hint=(
+                'Укажите в TOKEN_AUTH_CACHE_ALIAS алиас CACHES с '
+                'общим бэкендом (Redis, Memcached, база).'
+            ),
+            id='api.W001',
+        ),
+    ]
@@ -0,0 +1,157 @@
+import csv
+import hashlib
+import io
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Max
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+from recipes.models import DataVersion, Recipe, ShoppingListItem
+
+
+def get_shopping_list_rows(user):
+    return ShoppingListItem.objects.filter(
+        user=user,
+    ).values(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+        'total',
+    ).order_by('ingredient__name').iterator()
+
+
+def export_txt(rows):
+    for row in rows:
+        yield (
+            f'{row["ingredient__name"]}-{row["total"]},'
+            f'{row["ingredient__measurement_unit"]}\n'
+        )
+
+
+def export_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(('name', 'measurement_unit', 'amount'))
+    for row in rows:
+        writer.writerow((
+            row['ingredient__name'],
+            row['ingredient__measurement_unit'],
+            row['total'],
+        ))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_json(rows):
+    separator = '['
+    for row in rows:
+        yield separator + json.dumps(
+            {
+                'name': row['ingredient__name'],
+                'measurement_unit': row['ingredient__measurement_unit'],
+                'amount': row['total'],
+            },
+            ensure_ascii=False,
+        )
+        separator = ','
+    yield ']' if separator == ',' else '[]'
+
+
+EXPORTERS = {
+    'txt': (export_txt, 'text/plain'),
+    'csv': (export_csv, 'text/csv'),
+    'json': (export_json, 'application/json'),
+}
+
+
+class ShoppingListExport:
+    """Потоковая выгрузка списка покупок.
+
+    Строки берутся из сводной таблицы ShoppingListItem
+    и читаются через iterator(),
+    ответ отдаётся StreamingHttpResponse и не собирается
+    в памяти целиком. Выгрузки не больше MAX_SIZE байт
+    после отдачи сохраняются в кэш и в следующий раз
+    отдаются с Content-Length. ETag зависит от версий
+    списка покупок пользователя и ингредиентов и от
+    последнего изменения рецептов в списке.
+    """
+
+    def __init__(self, request, export_format):
+        self.request = request
+        self.user = request.user
+        self.format = export_format
+
+    @property
+    def options(self):
+        return getattr(settings, 'SHOPPING_LIST_CACHE', {})
+
+    @property
+    def cache(self):
+        return caches[self.options.get('ALIAS', 'default')]
+
+    @property
+    def filename(self):
+        return f'shopping_list.{self.format}'
+
+    def get_etag(self):
+        keys = [f'shopping_cart:{self.user.id}', 'ingredients']
+        versions = DataVersion.get_versions(keys)
+        updated_at = Recipe.objects.filter(
+            shopping_cart__user=self.user,
+        ).aggregate(updated_at=Max('updated_at'))['updated_at']
+        parts = [self.format, str(self.user.id), str(updated_at)] + [
+            f'{key}={versions.get(key, (0, None))[0]}' for key in keys
+        ]
+        return quote_etag(
+            hashlib.md5('|'.join(parts).encode()).hexdigest(),
+        )
+
+    def stream(self, cache_key):
+        exporter, _ = EXPORTERS[self.format]
+        max_size = self.options.get('MAX_SIZE', 256 * 1024)
+        chunks = []
+        size = 0
+        for chunk in exporter(get_shopping_list_rows(self.user)):
+            chunk = chunk.encode('utf-8')
+            if chunks is not None:
+                size += len(chunk)
+                chunks.append(chunk)
+                if size > max_size:
+                    chunks = None
+            yield chunk
+        if chunks is not None:
+            self.cache.set(
+                cache_key,
+                b''.join(chunks),
+                self.options.get('TIMEOUT', 600),
+            )
+
+    def get_response(self):
+        etag = self.get_etag()
+        response = get_conditional_response(self.request, etag=etag)
+        if response is not None:
+            response['ETag'] = etag
+            return response
+        _, content_type = EXPORTERS[self.format]
+        content_type = f'{content_type}; charset=utf-8'
+        cache_key = f'shopping_list:{etag}'
+        content = self.cache.get(cache_key)
+        if content is not None:
+            response = HttpResponse(content, content_type=content_type)
+            response['Content-Length'] = len(content)
+        else:
+            response = StreamingHttpResponse(
+                self.stream(cache_key),
+                content_type=content_type,
+            )
+        response['ETag'] = etag
+        response[
+            'Content-Disposition'
+        ] = f'attachment; filename="{self.filename}"'
+        return response
@@ -0,0 +1,97 @@
+import base64
+import binascii
+import uuid
+
+import filetype
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import ImageField
+
+BASE64_MARKER = ';base64,'
+DECODE_CHUNK_SIZE = 256 * 1024
+WHITESPACE = {ord(char): None for char in ' \t\r\n'}
+
+
+class StreamingImageField(Base64ImageField):
+    """Поле фото рецепта без декодирования base64 в память целиком.
+
+    Файл из multipart-запроса Django уже пишет во временный
+    файл, его только проверяем и переименовываем. Строку base64 декодируем
+    кусками по DECODE_CHUNK_SIZE символов сразу во временный
+    файл, поэтому раскодированные байты не держатся в памяти.
+
+    def close:
+        Закрывает временные файлы, раскодированные из base64.
+        Вызывается сериализатором после сохранения модели или
+        ошибки валидации: хранилище только переносит файл,
+        а открытый дескриптор остаётся за полем.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.decoded = []
+
+    def close(self):
+        while self.decoded:
+            self.decoded.pop().close()
+
+    def to_internal_value(self, data):
+        if isinstance(data, UploadedFile):
+            return self.validate_upload(data)
+        if data in self.EMPTY_VALUES or not isinstance(data, str):
+            return super().to_internal_value(data)
+        upload = self.decode_to_file(data)
+        try:
+            return self.validate_upload(upload)
+        except ValidationError:
+            upload.close()
+            raise
+
+    def validate_upload(self, upload):
+        upload.name = f'{uuid.uuid4()}.{self.get_upload_extension(upload)}'
+        return ImageField.to_internal_value(self, upload)
+
+    def decode_to_file(self, data):
+        start = data.find(BASE64_MARKER)
+        start = 0 if start == -1 else start + len(BASE64_MARKER)
+        upload = TemporaryUploadedFile(
+            name='upload',
+            content_type=None,
+            size=0,
+            charset=None,
+        )
+        self.decoded.append(upload)
+        rest = ''
+        try:
+            for offset in range(start, len(data), DECODE_CHUNK_SIZE):
+                chunk = rest + data[
+                    offset:offset + DECODE_CHUNK_SIZE
+                ].translate(WHITESPACE)
+                usable = len(chunk) - len(chunk) % 4
+                upload.write(base64.b64decode(chunk[:usable]))
+                rest = chunk[usable:]
+            if rest:
+                upload.write(base64.b64decode(rest))
+        except (TypeError, binascii.Error, ValueError):
+            upload.close()
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        upload.size = upload.tell()
+        upload.seek(0)
+        return upload
+
+    def get_upload_extension(self, upload):
+        extension = filetype.guess_extension(upload.read(261))
+        upload.seek(0)
+        if extension is None:
+            try:
+                extension = Image.open(upload).format.lower()
+            except OSError:
+                raise ValidationError(self.INVALID_FILE_MESSAGE)
+            finally:
+                upload.seek(0)
+        extension = 'jpg' if extension == 'jpeg' else extension
+        if extension not in self.ALLOWED_TYPES:
+            raise ValidationError(self.INVALID_TYPE_MESSAGE)
+        return extension
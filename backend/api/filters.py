@@ -1,5 +1,7 @@
+from django.db.models import Case, When
 from django_filters import rest_framework as filters
 
+from api.ingredient_index import ingredient_index
 from recipes.models import Ingredient, Recipe, Tag
 from users.models import User
 
@@ -8,17 +10,25 @@ class IngredientsFilter(filters.FilterSet):
     """
     Фильтрация ингредиентов.
 
-    Ищем по началу названия ингредиента.
+    Ищем по началу названия ингредиента. Пока включён
+    ingredient_index, совпадения и их порядок берутся из него,
+    как и в ответе на один ?name=: без учёта регистра и ё,
+    не больше INGREDIENT_INDEX['LIMIT'].
     """
-    name = filters.CharFilter(
-        field_name='name',
-        lookup_expr='istartswith',
-    )
+    name = filters.CharFilter(method='filter_name')
 
     class Meta:
         model = Ingredient
         fields = ('name',)
 
+    def filter_name(self, queryset, name, value):
+        if not ingredient_index.enabled:
+            return queryset.filter(name__istartswith=value)
+        ids = [row['id'] for row in ingredient_index.search(value)]
+        return queryset.filter(id__in=ids).order_by(Case(
+            *[When(id=pk, then=position) for position, pk in enumerate(ids)],
+        ))
+
 
 class RecipesFilter(filters.FilterSet):
     """"
@@ -33,6 +43,9 @@ class RecipesFilter(filters.FilterSet):
     def filter_is_in_shopping_cart:
         Фильтрация по статусу аноним/пользователь на
         странице списка покупок.
+
+    Оба фильтра опираются на аннотации favorited и
+    in_shopping_cart из RecipeViewSet.get_queryset.
     """
     tags = filters.ModelMultipleChoiceFilter(
         field_name='tags__slug',
@@ -54,24 +67,12 @@ class RecipesFilter(filters.FilterSet):
     def filter_is_favorited(self, queryset, name, value):
         if self.request.user.is_anonymous:
             return queryset
-        if value:
-            return queryset.filter(
-                favorite_recipe__user=self.request.user,
-            )
-        return queryset.exclude(
-            favorite_recipe__user=self.request.user,
-        )
+        return queryset.filter(favorited=value)
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         if self.request.user.is_anonymous:
             return queryset
-        if value:
-            return queryset.filter(
-                shopping_cart__user=self.request.user,
-            )
-        return queryset.exclude(
-            shopping_cart__user=self.request.user,
-        )
+        return queryset.filter(in_shopping_cart=value)
 
     class Meta:
         model = Recipe
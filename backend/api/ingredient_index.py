@@ -0,0 +1,111 @@
+import bisect
+import threading
+import time
+
+from django.conf import settings
+
+from recipes.models import DataVersion, Ingredient
+
+
+def fold(value):
+    """Приведение к ключу поиска: регистр и ё -> е."""
+    return value.casefold().replace('ё', 'е')
+
+
+class IngredientPrefixIndex:
+    """Индекс ингредиентов для автодополнения по началу названия.
+
+    Отсортированный список ключей в памяти процесса строится
+    при первом обращении. Сигналы сбрасывают его в этом
+    процессе, а изменения из других процессов замечаются по
+    версии 'ingredients' в DataVersion, которую проверяем
+    не чаще VERSION_CHECK_INTERVAL секунд.
+
+    def lookup:
+        Совпадения и версия, с которой построен индекс,
+        для ETag ответа без запроса к базе.
+    """
+
+    def __init__(self):
+        self._data = None
+        self._version = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    @property
+    def options(self):
+        return getattr(settings, 'INGREDIENT_INDEX', {})
+
+    @property
+    def enabled(self):
+        return self.options.get('ENABLED', True)
+
+    @property
+    def limit(self):
+        return self.options.get('LIMIT', 50)
+
+    @property
+    def check_interval(self):
+        return self.options.get('VERSION_CHECK_INTERVAL', 5)
+
+    def invalidate(self):
+        self._data = None
+
+    def get_version(self):
+        version, _ = DataVersion.get_versions(
+            ['ingredients'],
+        ).get('ingredients', (0, None))
+        return version
+
+    def build(self):
+        rows = sorted(
+            Ingredient.objects.values(
+                'id',
+                'name',
+                'measurement_unit',
+            ).order_by().iterator(),
+            key=lambda row: (fold(row['name']), row['name'], row['id']),
+        )
+        return [fold(row['name']) for row in rows], rows
+
+    def get_data(self):
+        now = time.monotonic()
+        data = self._data
+        if data is not None and now - self._checked_at < self.check_interval:
+            return data
+        with self._lock:
+            data = self._data
+            if (
+                data is None
+                or now - self._checked_at >= self.check_interval
+            ):
+                version = self.get_version()
+                if data is None or version != self._version:
+                    data = (*self.build(), version)
+                    self._data = data
+                    self._version = version
+                self._checked_at = now
+        return data
+
+    def search(self, prefix, limit=None):
+        result, _ = self.lookup(prefix, limit)
+        return result
+
+    def lookup(self, prefix, limit=None):
+        if limit is None:
+            limit = self.limit
+        keys, rows, version = self.get_data()
+        key = fold(prefix)
+        result = []
+        index = bisect.bisect_left(keys, key)
+        while (
+            index < len(keys)
+            and keys[index].startswith(key)
+            and (limit is None or len(result) < limit)
+        ):
+            result.append(rows[index])
+            index += 1
+        return result, version
+
+
+ingredient_index = IngredientPrefixIndex()
@@ -0,0 +1,184 @@
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from time import perf_counter
+
+from django.conf import settings
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+HISTOGRAMS = (
+    ('total', 'foodgram_request_duration_seconds',
+     'Время обработки запроса.'),
+    ('view', 'foodgram_request_view_seconds',
+     'Время во вьюхе с рендерингом ответа.'),
+    ('sql', 'foodgram_request_sql_seconds',
+     'Суммарное время SQL-запросов.'),
+    ('serializer', 'foodgram_request_serializer_seconds',
+     'Время сериализации ответа.'),
+    ('queries', 'foodgram_request_queries',
+     'Число SQL-запросов.'),
+)
+
+_local = threading.local()
+
+
+def get_options():
+    return getattr(settings, 'REQUEST_METRICS', {})
+
+
+class RequestMetrics:
+    """Замеры одного запроса.
+
+    def execute:
+        Обёртка connection.execute_wrapper, считает
+        запросы и их суммарное время.
+    def get_server_timing:
+        Значение заголовка Server-Timing.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.sql = 0.0
+        self.serializer = 0.0
+        self.view = 0.0
+        self.total = 0.0
+
+    def execute(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql += perf_counter() - started
+
+    def get_server_timing(self):
+        return ', '.join((
+            f'db;dur={self.sql * 1000:.1f};desc="{self.queries} queries"',
+            f'serializer;dur={self.serializer * 1000:.1f}',
+            f'view;dur={self.view * 1000:.1f}',
+            f'total;dur={self.total * 1000:.1f}',
+        ))
+
+
+def get_current():
+    return getattr(_local, 'metrics', None)
+
+
+def set_current(metrics):
+    _local.metrics = metrics
+
+
+@contextmanager
+def measure(name):
+    """Добавляет время блока к замеру name текущего запроса."""
+    metrics = get_current()
+    if metrics is None:
+        yield
+        return
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        setattr(
+            metrics,
+            name,
+            getattr(metrics, name) + perf_counter() - started,
+        )
+
+
+def measure_serializer(serializer):
+    """Засекает to_representation корневого сериализатора.
+
+    Обёртка ставится только на замеряемые запросы,
+    остальные сериализаторы не меняются.
+    """
+    if get_current() is None:
+        return serializer
+    to_representation = serializer.to_representation
+
+    def timed_to_representation(instance):
+        with measure('serializer'):
+            return to_representation(instance)
+
+    serializer.to_representation = timed_to_representation
+    return serializer
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    """Гистограммы замеров по маршрутам.
+
+    Маршрут - имя вьюхи из resolver_match, например
+    api:recipes-list, поэтому меток немного. Данные
+    копятся в памяти процесса: каждый воркер gunicorn
+    отдаёт свои гистограммы.
+    """
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def get_buckets(self, name):
+        if name == 'queries':
+            return QUERY_BUCKETS
+        return tuple(get_options().get('BUCKETS', DEFAULT_BUCKETS))
+
+    def observe(self, route, method, metrics):
+        with self._lock:
+            for name, _, _ in HISTOGRAMS:
+                key = (name, route, method)
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram(
+                        self.get_buckets(name),
+                    )
+                histogram.observe(getattr(metrics, name))
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, metric, description in HISTOGRAMS:
+                lines.append(f'# HELP {metric} {description}')
+                lines.append(f'# TYPE {metric} histogram')
+                for (key, route, method), histogram in sorted(
+                    self._histograms.items(),
+                ):
+                    if key != name:
+                        continue
+                    labels = f'route="{route}",method="{method}"'
+                    cumulative = 0
+                    for bound, count in zip(
+                        histogram.buckets + ('+Inf',),
+                        histogram.counts,
+                    ):
+                        cumulative += count
+                        lines.append(
+                            f'{metric}_bucket{{{labels},le="{bound}"}} '
+                            f'{cumulative}',
+                        )
+                    lines.append(f'{metric}_sum{{{labels}}} {histogram.sum}')
+                    lines.append(
+                        f'{metric}_count{{{labels}}} {cumulative}',
+                    )
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+metrics_registry = MetricsRegistry()
@@ -0,0 +1,64 @@
+import random
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.db import connections
+
+from api.metrics import (RequestMetrics, get_options, metrics_registry,
+                         set_current)
+
+
+class RequestMetricsMiddleware:
+    """Замеры запросов: SQL, сериализация, вьюха, итог.
+
+    Замеряется доля SAMPLE_RATE запросов, остальные
+    проходят без обёрток. Замеры попадают в гистограммы
+    metrics_registry, а при SERVER_TIMING - ещё и
+    в заголовок Server-Timing ответа. Для потоковых
+    ответов учитывается время до начала отдачи тела.
+    Стоит первым в MIDDLEWARE, чтобы итог включал
+    остальные middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def is_sampled(self, options):
+        if not options.get('ENABLED', False):
+            return False
+        return random.random() < options.get('SAMPLE_RATE', 1.0)
+
+    def __call__(self, request):
+        options = get_options()
+        if not self.is_sampled(options):
+            return self.get_response(request)
+        metrics = RequestMetrics()
+        request.metrics = metrics
+        set_current(metrics)
+        started = perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(metrics.execute),
+                    )
+                response = self.get_response(request)
+        finally:
+            set_current(None)
+        now = perf_counter()
+        metrics.total = now - started
+        if hasattr(request, 'metrics_view_started'):
+            metrics.view = now - request.metrics_view_started
+        match = request.resolver_match
+        metrics_registry.observe(
+            match.view_name if match else 'unmatched',
+            request.method,
+            metrics,
+        )
+        if options.get('SERVER_TIMING', False):
+            response['Server-Timing'] = metrics.get_server_timing()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, 'metrics'):
+            request.metrics_view_started = perf_counter()
@@ -0,0 +1,185 @@
+import hashlib
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from api.metrics import measure_serializer
+from recipes.models import DataVersion
+
+
+class ConditionalListMixin:
+    """Условный GET для списков.
+
+    ETag и Last-Modified считаются по версиям данных
+    DataVersion. Если валидатор клиента совпадает,
+    отдаём 304 без запроса выборки и сериализации.
+
+    version_keys - общие ключи версий (таблицы),
+    user_version_keys - ключи, зависящие от пользователя,
+    к ним добавляется его id.
+    """
+    version_keys = ()
+    user_version_keys = ()
+
+    def get_version_keys(self, request):
+        keys = list(self.version_keys)
+        if request.user.is_authenticated:
+            keys.extend(
+                f'{key}:{request.user.id}'
+                for key in self.user_version_keys
+            )
+        return keys
+
+    def get_validators(self, request):
+        keys = self.get_version_keys(request)
+        versions = DataVersion.get_versions(keys)
+        parts = [request.get_full_path(), str(request.user.pk)]
+        stamps = []
+        for key in keys:
+            version, updated_at = versions.get(key, (0, None))
+            parts.append(f'{key}={version}')
+            if updated_at is not None:
+                stamps.append(updated_at)
+        etag = quote_etag(
+            hashlib.md5('|'.join(parts).encode()).hexdigest(),
+        )
+        last_modified = int(max(stamps).timestamp()) if stamps else None
+        return etag, last_modified
+
+    def list(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators(request)
+        response = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=last_modified,
+        )
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        if self.user_version_keys:
+            patch_vary_headers(response, ('Authorization',))
+        return response
+
+
+class AnonymousListCacheMixin:
+    """Кэширование отрендеренного списка для анонимов.
+
+    Ответы в JSON для неавторизованных пользователей берутся
+    из list_cache (см. api.cache.RecipeListCache), а при
+    промахе сохраняются туда после рендеринга.
+
+    def get_cache_variant:
+        Пагинатор и его режим для ключа: курсорная и
+        постраничная выдача одного запроса различаются.
+    """
+    list_cache = None
+
+    def get_cache_variant(self, request):
+        paginator = self.paginator
+        if paginator is None:
+            return ''
+        variant = type(paginator).__name__
+        cursor_param = getattr(paginator, 'cursor_query_param', None)
+        if cursor_param and cursor_param in request.query_params:
+            return f'{variant}-cursor'
+        return variant
+
+    def list(self, request, *args, **kwargs):
+        if (
+            self.list_cache is None
+            or not self.list_cache.enabled
+            or request.user.is_authenticated
+            or request.accepted_renderer.format != 'json'
+        ):
+            return super().list(request, *args, **kwargs)
+        key = self.list_cache.get_key(
+            request,
+            self.get_cache_variant(request),
+        )
+        cached = self.list_cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+            patch_vary_headers(response, ('Accept',))
+            return response
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            response.add_post_render_callback(
+                lambda rendered: self.list_cache.set(
+                    key,
+                    (rendered.content, rendered['Content-Type']),
+                ),
+            )
+        return response
+
+
+class PrefixIndexListMixin:
+    """Ответ на поиск по началу названия из индекса в памяти.
+
+    Если в запросе есть только параметр prefix_index_param,
+    список берётся из prefix_index без запроса к базе.
+    ETag строится по версии, с которой построен индекс,
+    поэтому миксин стоит раньше ConditionalListMixin.
+    """
+    prefix_index = None
+    prefix_index_param = 'name'
+
+    def list(self, request, *args, **kwargs):
+        prefix = request.query_params.get(self.prefix_index_param)
+        if (
+            self.prefix_index is None
+            or not self.prefix_index.enabled
+            or not prefix
+            or len(request.query_params) > 1
+        ):
+            return super().list(request, *args, **kwargs)
+        rows, version = self.prefix_index.lookup(prefix)
+        etag = quote_etag(hashlib.md5(
+            f'{request.get_full_path()}|{version}'.encode(),
+        ).hexdigest())
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = Response(rows)
+        response['ETag'] = etag
+        return response
+
+
+class SnapshotListMixin:
+    """Полный список без параметров из готового снимка.
+
+    snapshot (см. api.catalog.IngredientCatalogSnapshot) отдаёт
+    уже отрендеренный и сжатый под Accept-Encoding ответ
+    с собственным сильным ETag.
+    """
+    snapshot = None
+
+    def list(self, request, *args, **kwargs):
+        if (
+            self.snapshot is None
+            or request.query_params
+            or request.accepted_renderer.format != 'json'
+        ):
+            return super().list(request, *args, **kwargs)
+        encoding, content, etag = self.snapshot.get(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''),
+        )
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(content, content_type='application/json')
+            if encoding is not None:
+                response['Content-Encoding'] = encoding
+            response['Content-Length'] = len(content)
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+        return response
+
+
+class SerializerTimingMixin:
+    """Засекает сериализацию ответа для RequestMetricsMiddleware."""
+
+    def get_serializer(self, *args, **kwargs):
+        return measure_serializer(super().get_serializer(*args, **kwargs))
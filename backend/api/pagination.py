@@ -1,4 +1,17 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class LimitCursorPagination(CursorPagination):
+    """
+    Курсорная пагинация без COUNT(*) и OFFSET.
+
+    Размер страницы задаётся тем же параметром limit,
+    что и в постраничной пагинации.
+    """
+
+    page_size = 6
+    page_size_query_param = 'limit'
+    ordering = ('-id',)
 
 
 class PageLimitPagination(PageNumberPagination):
@@ -6,7 +19,66 @@ class PageLimitPagination(PageNumberPagination):
     Определение стандарта пагинации для вывода
     определенного количества рецептов на страницах
     рецептов и избранного.
+
+    Если в запросе передан параметр cursor (в том числе
+    пустой), страница строится курсорной пагинацией
+    с порядком cursor_ordering. Без него ответы остаются
+    постраничными, как ожидает фронтенд.
     """
 
     page_size = 6
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    cursor_ordering = ('-id',)
+    cursor_paginator = None
+
+    def get_cursor_paginator(self):
+        paginator = LimitCursorPagination()
+        paginator.page_size = self.page_size
+        paginator.ordering = self.cursor_ordering
+        return paginator
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param in request.query_params:
+            self.cursor_paginator = self.get_cursor_paginator()
+            return self.cursor_paginator.paginate_queryset(
+                queryset,
+                request,
+                view,
+            )
+        self.cursor_paginator = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class RecipePagination(PageLimitPagination):
+    """
+    Пагинация рецептов.
+
+    Курсор строится по дате публикации, id разрешает
+    совпадения дат.
+    """
+
+    cursor_ordering = ('-pub_date', '-id')
+
+
+class UserPagination(PageLimitPagination):
+    """Пагинация пользователей и подписок, курсор по id."""
+
+    cursor_ordering = ('id',)
+
+
+class FeedPagination(LimitCursorPagination):
+    """
+    Курсорная пагинация ленты подписок.
+
+    Страница строится по записям FeedEntry, а не по
+    рецептам: порядок совпадает с индексом
+    (user, -pub_date, -recipe).
+    """
+
+    ordering = ('-pub_date', '-recipe_id')
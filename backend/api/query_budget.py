@@ -0,0 +1,154 @@
+import os
+import re
+import sys
+from collections import Counter, defaultdict, namedtuple
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.serializers import Serializer
+
+PLACEHOLDERS = re.compile(r'\((?:%s|\?)(?:\s*,\s*(?:%s|\?))*\)')
+# Управление транзакциями: внутри TestCase каждый atomic
+# даёт SAVEPOINT и RELEASE вместо BEGIN, на PostgreSQL
+# BEGIN не попадает в курсор вовсе.
+TRANSACTION_CONTROL = re.compile(
+    r'^\s*(?:BEGIN|SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT)\b',
+    re.IGNORECASE,
+)
+
+CapturedQuery = namedtuple('CapturedQuery', ('sql', 'call_site'))
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Запросов больше, чем разрешено бюджетом."""
+
+
+def normalize_sql(sql):
+    """Сворачивает списки параметров IN (%s, %s, ...) в IN (...)."""
+    return PLACEHOLDERS.sub('(...)', sql)
+
+
+def get_serializer_field(frame):
+    """Поле, которое рендерит to_representation сериализатора."""
+    serializer = frame.f_locals.get('self')
+    field = frame.f_locals.get('field')
+    if (
+        frame.f_code.co_name != 'to_representation'
+        or not isinstance(serializer, Serializer)
+        or field is None
+    ):
+        return None
+    return f'{type(serializer).__name__}.{field.field_name}'
+
+
+def get_call_site():
+    """Место запроса: ближайший кадр из кода проекта.
+
+    Кадры Django, DRF и других пакетов пропускаются.
+    Если запрос случился при рендеринге сериализатора,
+    добавляется и поле - для вложенных сериализаторов
+    кадр проекта указывает лишь на вьюху.
+    """
+    root = str(settings.BASE_DIR) + os.sep
+    location = field = None
+    frame = sys._getframe(1)
+    while frame is not None and (location is None or field is None):
+        filename = frame.f_code.co_filename
+        if location is None and (
+            filename.startswith(root)
+            and 'site-packages' not in filename
+            and filename != __file__
+        ):
+            location = (
+                f'{os.path.relpath(filename, root)}:{frame.f_lineno} '
+                f'({frame.f_code.co_name})'
+            )
+        if field is None:
+            field = get_serializer_field(frame)
+        frame = frame.f_back
+    location = location or 'вне кода проекта'
+    if field is None:
+        return location
+    return f'{location}, поле {field}'
+
+
+class QueryLog:
+    """Запись SQL-запросов со всех подключений.
+
+    Для каждого запроса запоминается место вызова
+    (get_call_site), поэтому медленнее обычного
+    execute_wrapper -
+    для проверок, а не для продакшена. Команды управления
+    транзакциями не считаются, чтобы бюджеты не зависели
+    от базы и от того, идёт ли запрос внутри TestCase.
+
+    def get_duplicates:
+        Повторяющиеся запросы, сгруппированные по месту
+        вызова: {место: [(sql, сколько раз), ...]}.
+    def format_duplicates:
+        То же текстом для сообщения об ошибке.
+    def check_budget:
+        Бросает QueryBudgetExceeded, если запросов
+        больше budget.
+    """
+
+    def __init__(self):
+        self.queries = []
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(
+                connection.execute_wrapper(self.execute),
+            )
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def __len__(self):
+        return len(self.queries)
+
+    def execute(self, execute, sql, params, many, context):
+        if not TRANSACTION_CONTROL.match(sql):
+            self.queries.append(
+                CapturedQuery(normalize_sql(sql), get_call_site()),
+            )
+        return execute(sql, params, many, context)
+
+    def get_duplicates(self):
+        counts = Counter(self.queries)
+        duplicates = defaultdict(list)
+        for (sql, call_site), count in counts.most_common():
+            if count > 1:
+                duplicates[call_site].append((sql, count))
+        return dict(duplicates)
+
+    def format_duplicates(self):
+        lines = []
+        for call_site, queries in self.get_duplicates().items():
+            lines.append(f'  {call_site}:')
+            for sql, count in queries:
+                lines.append(f'    {count}x {sql}')
+        return '\n'.join(lines) or '  повторов нет'
+
+    def check_budget(self, budget, label='запрос'):
+        if len(self) > budget:
+            raise QueryBudgetExceeded(
+                f'{label}: {len(self)} запросов при бюджете {budget}.\n'
+                f'Повторяющиеся запросы:\n{self.format_duplicates()}',
+            )
+
+
+@contextmanager
+def query_budget(budget, label='запрос'):
+    """Проверяет, что в блоке не больше budget SQL-запросов.
+
+    При превышении бросает QueryBudgetExceeded со списком
+    повторяющихся запросов по местам вызова.
+    """
+    with QueryLog() as log:
+        yield log
+    log.check_budget(budget, label)
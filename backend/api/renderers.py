@@ -0,0 +1,92 @@
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson, если пакет установлен.
+
+    Даты, Decimal, ленивые строки и прочие типы, которых
+    orjson не знает, отдаются в encoder_class DRF, поэтому
+    байты ответа совпадают с JSONRenderer. Отступы, ASCII
+    или не-компактный вывод, а также то, что orjson не
+    сериализует (целые больше 64 бит, ключи не-строки),
+    рендерит базовый класс на json.
+    Расходится с json только запись float в экспоненте
+    (1e16 вместо 1e+16) и NaN; таких полей в API нет.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or not self.strict
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME,
+            )
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Как и JSONRenderer, экранируем разделители строк
+        # для встраивания ответа в JavaScript.
+        return ret.replace(
+            '\u2028'.encode(),
+            b'\\u2028',
+        ).replace(
+            '\u2029'.encode(),
+            b'\\u2029',
+        )
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """Базовый рендерер выгрузки списка покупок.
+
+    Сам список отдаётся потоковым ответом, рендерер нужен
+    для выбора формата через ?format= и для ответов
+    с ошибками.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+
+class ShoppingListTextRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class ShoppingListCSVRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class ShoppingListJSONRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+
+class PrometheusRenderer(BaseRenderer):
+    """Текстовый формат Prometheus для MetricsView."""
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, str):
+            return data.encode(self.charset)
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
@@ -1,16 +1,47 @@
+import json
+from collections import Counter
+
 import django.contrib.auth.password_validation as validators
+from django.db import transaction
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
+from api.fields import StreamingImageField
+from core.utils import get_subscribed_ids
 from recipes.models import (FavoriteRecipes, Ingredient, IngredientsInRecipe,
-                            Recipe, ShoppingCart, Subscribe, Tag, User)
+                            Recipe, ShoppingCart, ShoppingListItem, Subscribe,
+                            Tag, User)
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии фото рецепта.
+
+    Пока копии не готовы, отдаётся пустой словарь и
+    клиент использует исходное фото.
+    """
+
+    def to_representation(self, variants):
+        request = self.context.get('request')
+        storage = Recipe._meta.get_field('image').storage
+        urls = {}
+        for size_name, files in variants.items():
+            if size_name == 'source':
+                continue
+            urls[size_name] = {}
+            for extension, name in files.items():
+                url = storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                urls[size_name][extension] = url
+        return urls
 
 
 class UserSerializer(serializers.ModelSerializer):
     """Сериализация для созданного пользователя.
 
     def get_is_subscribed:
-        Проверяем наличии подписки.
+        Проверяем наличии подписки по множеству id авторов,
+        загруженному один раз за запрос.
         Returns:
             Если нет - просто False.
             Если да - модель пользователя-подписчика.
@@ -34,8 +65,7 @@ class UserSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
-        return Subscribe.objects.filter(
-            user=request.user, subscriber=data.id).exists()
+        return data.id in get_subscribed_ids(request)
 
 
 class UserCreateSerializer(serializers.ModelSerializer):
@@ -84,10 +114,14 @@ class IngredientSerializer(serializers.ModelSerializer):
 
 
 class IngredientsAddSerializer(serializers.ModelSerializer):
-    """Сериализация ингредиентов на вход при создании рецепта."""
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(),
-        source='ingredient.id',
+    """Сериализация ингредиентов на вход при создании рецепта.
+
+    Существование ингредиентов проверяет одним запросом
+    RecipeAddSerializer.validate_ingredients.
+    """
+    id = serializers.IntegerField(
+        min_value=1,
+        source='ingredient_id',
     )
 
     class Meta:
@@ -119,8 +153,11 @@ class RecipeReadSeriaizer(serializers.ModelSerializer):
 
     def get_is_favorited:
         Проверка добавлен ли рецепт в избранное.
+        Если queryset аннотирован во вьюсете,
+        берём готовый флаг без запроса к базе.
     def get_is_in_shopping_cart:
         Проверка добавлен ли рецепт в список покупок.
+        Аналогично использует аннотацию вьюсета.
     """
     author = UserSerializer(read_only=True)
     tags = TagSerializer(many=True, read_only=True)
@@ -133,6 +170,7 @@ class RecipeReadSeriaizer(serializers.ModelSerializer):
         max_length=None,
         use_url=True,
     )
+    image_variants = ImageVariantsField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -142,6 +180,7 @@ class RecipeReadSeriaizer(serializers.ModelSerializer):
             'id',
             'tags',
             'image',
+            'image_variants',
             'author',
             'ingredients',
             'is_favorited',
@@ -155,6 +194,8 @@ class RecipeReadSeriaizer(serializers.ModelSerializer):
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
+        if hasattr(instance, 'favorited'):
+            return instance.favorited
         return FavoriteRecipes.objects.filter(
             user=user,
             recipe_id=instance.id,
@@ -164,12 +205,28 @@ class RecipeReadSeriaizer(serializers.ModelSerializer):
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
+        if hasattr(instance, 'in_shopping_cart'):
+            return instance.in_shopping_cart
         return ShoppingCart.objects.filter(
             user=user,
             recipe_id=instance.id,
         ).exists()
 
 
+class RecipeDetailSerializer(RecipeReadSeriaizer):
+    """Сериализатор страницы рецепта со счётчиками.
+
+    Счётчики отдаются только на странице рецепта, чтобы
+    добавления в избранное не сбрасывали ETag и кэш списков.
+    """
+
+    class Meta(RecipeReadSeriaizer.Meta):
+        fields = RecipeReadSeriaizer.Meta.fields + (
+            'favorites_count',
+            'shopping_cart_count',
+        )
+
+
 class RecipeAddSerializer(serializers.ModelSerializer):
     """Серилазатор для добавления новых рецептов.
 
@@ -179,33 +236,45 @@ class RecipeAddSerializer(serializers.ModelSerializer):
         Проверка добавлен ли рецепт в список покупок.
             Если нет - просто False.
             Если да- модель рецепта из списка покупок.
-    def validate:
-        Валидация входящей информации, в частности
-        проверка уникальности ингредиентов и проверка
-        наличия тега.
+    def validate_tags:
+        Проверка наличия тега, уникальности и
+        существования тегов одним запросом.
     def validate_ingredients:
         Валидация ингредиентов на вход, не менее
-        определенного количества.
+        определенного количества, уникальные и
+        существующие - тоже одним запросом.
+        Все ошибки полей возвращаются одним ответом.
     def create:
         Переопределение базового метода для
-        создание рецепта.
+        создание рецепта в одной транзакции.
     def update:
         Переопределение базового метода для
-        редактировани рецепта.
+        редактировани рецепта. Ингредиенты и теги
+        сравниваются с сохранёнными: меняются только
+        отличающиеся строки, а если поля нет в запросе,
+        связи не трогаются. Сводные списки покупок
+        пересчитываются в той же транзакции и только
+        по изменённым ингредиентам.
+    def run_validation, save:
+        Закрывают временный файл фото из base64 после
+        сохранения рецепта или ошибки валидации.
+    def to_internal_value:
+        Приводит multipart-запрос (фото файлом, ингредиенты
+        JSON-строкой, теги списком) к виду JSON-запроса.
     def to_represantation:
         Переопределение базового метода для
-        чтения созданного рецепта.
+        чтения созданного рецепта. Рецепт читается
+        заново с предзагрузкой связей.
     """
 
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True,
-        queryset=Tag.objects.all(),
+    tags = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
     )
     ingredients = IngredientsAddSerializer(
         many=True,
         source='ingredients_recipe',
     )
-    image = Base64ImageField(
+    image = StreamingImageField(
         max_length=None,
         use_url=True,
     )
@@ -230,6 +299,8 @@ class RecipeAddSerializer(serializers.ModelSerializer):
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
+        if hasattr(instance, 'favorited'):
+            return instance.favorited
         return FavoriteRecipes.objects.filter(
             user=user,
             recipe_id=instance.id,
@@ -239,36 +310,92 @@ class RecipeAddSerializer(serializers.ModelSerializer):
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
+        if hasattr(instance, 'in_shopping_cart'):
+            return instance.in_shopping_cart
         return ShoppingCart.objects.filter(
             user=user,
             recipe_id=instance.id,
         ).exists()
 
-    def validate(self, data):
-        ingredients = data['ingredients_recipe']
-        ingredient_list = []
-        for ingredient in ingredients:
-            if ingredient in ingredient_list:
+    def run_validation(self, data=serializers.empty):
+        try:
+            return super().run_validation(data)
+        except serializers.ValidationError:
+            self.fields['image'].close()
+            raise
+
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            self.fields['image'].close()
+
+    def to_internal_value(self, data):
+        if hasattr(data, 'getlist'):
+            data = self.parse_multipart(data)
+        return super().to_internal_value(data)
+
+    def parse_multipart(self, data):
+        parsed = {key: data.get(key) for key in data}
+        if 'tags' in data:
+            parsed['tags'] = data.getlist('tags')
+        if 'ingredients' in data:
+            try:
+                parsed['ingredients'] = json.loads(data['ingredients'])
+            except ValueError:
                 raise serializers.ValidationError(
-                    'Ингредиент должен быть уникальным!',
+                    {'ingredients': 'Ожидается JSON-список ингредиентов.'},
                 )
-            ingredient_list.append(ingredient)
-        if len(ingredient_list) == 0:
-            raise serializers.ValidationError(
-                'Минимально должен быть 1 ингредиент в рецепте!',
+        return parsed
+
+    def get_id_errors(self, queryset, ids, name):
+        counts = Counter(ids)
+        errors = []
+        duplicates = [pk for pk, count in counts.items() if count > 1]
+        if duplicates:
+            errors.append(
+                f'{name} должен быть уникальным: '
+                f'{", ".join(map(str, sorted(duplicates)))}.',
             )
-        for ingredient in ingredient_list:
-            if int(ingredient.get('amount')) < 1:
-                raise serializers.ValidationError(
-                    'Недопустимо количество ингредиента меньше 1!',
-                )
-        tags = data['tags']
+        missing = counts.keys() - set(
+            queryset.filter(id__in=counts).values_list('id', flat=True),
+        )
+        if missing:
+            errors.append(
+                f'{name} не существует: '
+                f'{", ".join(map(str, sorted(missing)))}.',
+            )
+        return errors
+
+    def validate_tags(self, tags):
         if not tags:
             raise serializers.ValidationError(
                 'Нужен хотя бы один тэг для рецепта!',
             )
-        return data
+        errors = self.get_id_errors(Tag.objects, tags, 'Тэг')
+        if errors:
+            raise serializers.ValidationError(errors)
+        return tags
+
+    def validate_ingredients(self, ingredients):
+        if not ingredients:
+            raise serializers.ValidationError(
+                'Минимально должен быть 1 ингредиент в рецепте!',
+            )
+        if any('amount' not in ingredient for ingredient in ingredients):
+            raise serializers.ValidationError(
+                'Укажите количество для каждого ингредиента!',
+            )
+        errors = self.get_id_errors(
+            Ingredient.objects,
+            [ingredient['ingredient_id'] for ingredient in ingredients],
+            'Ингредиент',
+        )
+        if errors:
+            raise serializers.ValidationError(errors)
+        return ingredients
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients_recipe')
         tags = validated_data.pop('tags')
@@ -280,17 +407,28 @@ class RecipeAddSerializer(serializers.ModelSerializer):
         self.add_ingredients(recipe, ingredients)
         return recipe
 
+    @transaction.atomic
     def update(self, recipe, validated_data):
-        ingredients = validated_data.pop('ingredients_recipe')
-        self.add_ingredients(recipe, ingredients)
-        recipe.tags.clear()
-        recipe.tags.set(validated_data.pop('tags'))
+        ingredients = validated_data.pop('ingredients_recipe', None)
+        if ingredients is not None:
+            changed_ids = self.update_ingredients(recipe, ingredients)
+            if changed_ids:
+                ShoppingListItem.refresh_for_recipe(recipe.id, changed_ids)
+        tags = validated_data.pop('tags', None)
+        if tags is not None:
+            recipe.tags.set(tags)
         return super().update(
             recipe,
             validated_data,
         )
 
     def to_representation(self, instance):
+        instance = Recipe.objects.select_related(
+            'author',
+        ).prefetch_related(
+            'tags',
+            'ingredients_recipe__ingredient',
+        ).get(pk=instance.pk)
         return RecipeReadSeriaizer(
             instance,
             context={
@@ -299,17 +437,48 @@ class RecipeAddSerializer(serializers.ModelSerializer):
         ).data
 
     def add_ingredients(self, recipe, ingredients):
-        recipe.ingredients.clear()
-        ingredients_list = []
-        for ingredient in ingredients:
-            ingredients_list.append(
-                IngredientsInRecipe(
-                    recipe=recipe,
-                    amount=ingredient.get('amount'),
-                    ingredient_id=ingredient['ingredient']['id'].id,
-                ),
+        IngredientsInRecipe.objects.bulk_create(
+            IngredientsInRecipe(
+                recipe=recipe,
+                amount=ingredient['amount'],
+                ingredient_id=ingredient['ingredient_id'],
             )
-        IngredientsInRecipe.objects.bulk_create(ingredients_list)
+            for ingredient in ingredients
+        )
+
+    def update_ingredients(self, recipe, ingredients):
+        current = {
+            row.ingredient_id: row
+            for row in recipe.ingredients_recipe.all()
+        }
+        amounts = {
+            ingredient['ingredient_id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        removed = current.keys() - amounts.keys()
+        added = [
+            ingredient for ingredient in ingredients
+            if ingredient['ingredient_id'] not in current
+        ]
+        changed = [
+            row for ingredient_id, row in current.items()
+            if ingredient_id in amounts
+            and row.amount != amounts[ingredient_id]
+        ]
+        if removed:
+            IngredientsInRecipe.objects.filter(
+                recipe=recipe,
+                ingredient_id__in=removed,
+            ).delete()
+        for row in changed:
+            row.amount = amounts[row.ingredient_id]
+        if changed:
+            IngredientsInRecipe.objects.bulk_update(changed, ['amount'])
+        if added:
+            self.add_ingredients(recipe, added)
+        return removed.union(
+            ingredient['ingredient_id'] for ingredient in added
+        ).union(row.ingredient_id for row in changed)
 
 
 class SubscribeSerializer(serializers.ModelSerializer):
@@ -319,32 +488,27 @@ class SubscribeSerializer(serializers.ModelSerializer):
         fields = ('user', 'subscriber')
 
 
-class LimitRecipeForSubscriptionsSerializer(serializers.ListSerializer):
-    """Ограниченный вывод рецептов на странице подписки."""
-    def to_representation(self, data):
-        limit_recipe = self.context.get(
-            'request',
-        ).query_params.get('recipes_limit')
-        if limit_recipe:
-            data = data.all()[:int(limit_recipe)]
-        return super(
-            LimitRecipeForSubscriptionsSerializer,
-            self
-        ).to_representation(data)
+class SubscribeRecipeSerializer(serializers.ModelSerializer):
+    """Сериализация рецептов для подписки.
 
+    Ограничение recipes_limit применяется при предзагрузке
+    рецептов в UsersViewSet.subscriptions.
+    """
+    image = Base64ImageField(
+        max_length=None,
+        use_url=True,
+    )
+    image_variants = ImageVariantsField()
 
-class SubscribeRecipeSerializer(RecipeReadSeriaizer):
-    """Сериализация рецептов для подписки."""
     class Meta:
-        list_serializer_class = LimitRecipeForSubscriptionsSerializer
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
 class SubscriptionSerializer(UserSerializer):
     """Сериализация подписчиков."""
     recipes = SubscribeRecipeSerializer(many=True)
-    recipes_count = serializers.IntegerField()
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta(UserSerializer.Meta):
         fields = (
@@ -365,8 +529,9 @@ class FavoriteShoppingCartSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(source='recipe.id')
     name = serializers.CharField(source='recipe.name')
     image = Base64ImageField(source='recipe.image')
+    image_variants = ImageVariantsField(source='recipe.image_variants')
     cooking_time = serializers.IntegerField(source='recipe.cooking_time')
 
     class Meta:
         model = FavoriteRecipes
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
@@ -0,0 +1,128 @@
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import token_user_cache
+from api.cache import recipe_list_cache
+from api.ingredient_index import ingredient_index
+from recipes.models import Ingredient, IngredientsInRecipe, Recipe, Tag
+from users.models import User
+
+
+def get_recipe_dependencies(recipe, tag_slugs=None):
+    if tag_slugs is None:
+        tag_slugs = recipe.tags.values_list('slug', flat=True)
+    return (
+        ['all', f'author:{recipe.author_id}']
+        + [f'tag:{slug}' for slug in tag_slugs]
+    )
+
+
+def bump_on_commit(names):
+    transaction.on_commit(lambda: recipe_list_cache.bump(*names))
+
+
+@receiver(post_save, sender=Recipe)
+def invalidate_saved_recipe(sender, instance, **kwargs):
+    bump_on_commit(get_recipe_dependencies(instance))
+
+
+@receiver(pre_delete, sender=Recipe)
+def invalidate_deleted_recipe(sender, instance, **kwargs):
+    bump_on_commit(get_recipe_dependencies(instance))
+
+
+class PendingRecipes:
+    """Рецепты, чьи страницы сбрасываются после коммита.
+
+    Строки ингредиентов меняются пачками, поэтому зависимости
+    считаются один раз на транзакцию, а не на каждую строку.
+    """
+
+    def __init__(self, recipe_id):
+        self.ids = {recipe_id}
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        for recipe in Recipe.objects.filter(
+            pk__in=self.ids,
+        ).prefetch_related('tags'):
+            recipe_list_cache.bump(*get_recipe_dependencies(
+                recipe,
+                [tag.slug for tag in recipe.tags.all()],
+            ))
+
+
+def bump_recipe_on_commit(recipe_id):
+    for _, func in transaction.get_connection().run_on_commit:
+        if isinstance(func, PendingRecipes) and not func.done:
+            func.ids.add(recipe_id)
+            return
+    transaction.on_commit(PendingRecipes(recipe_id))
+
+
+# bulk_create и bulk_update сигналов не шлют: сериализатор
+# рецепта после них сохраняет сам рецепт, и страницы
+# сбрасывает invalidate_saved_recipe.
+@receiver((post_save, post_delete), sender=IngredientsInRecipe)
+def invalidate_recipe_ingredients(sender, instance, **kwargs):
+    bump_recipe_on_commit(instance.recipe_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    if reverse:
+        if action.startswith('post_'):
+            bump_on_commit(['global'])
+        return
+    if action == 'pre_clear':
+        bump_on_commit(get_recipe_dependencies(instance))
+    elif action in ('post_add', 'post_remove'):
+        bump_on_commit(get_recipe_dependencies(
+            instance,
+            Tag.objects.filter(pk__in=pk_set).values_list('slug', flat=True),
+        ))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_all_pages(sender, **kwargs):
+    bump_on_commit(['global'])
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_pages(sender, instance, **kwargs):
+    # list_fields_changed выставляет pre_save из recipes.signals:
+    # регистрация и смена пароля страниц рецептов не меняют,
+    # удаление автора приходит сигналами удаления рецептов.
+    if instance.list_fields_changed:
+        bump_on_commit(['global'])
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    transaction.on_commit(ingredient_index.invalidate)
+
+
+def invalidate_tokens(func, *args):
+    # Сразу и после коммита: иначе параллельный запрос успеет
+    # закэшировать ещё не изменённые в базе данные.
+    func(*args)
+    transaction.on_commit(lambda: func(*args))
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    invalidate_tokens(token_user_cache.invalidate, instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, created, update_fields=None,
+                           **kwargs):
+    if created or update_fields and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_tokens(token_user_cache.invalidate_user, instance.pk)
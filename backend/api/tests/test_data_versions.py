@@ -0,0 +1,122 @@
+from django.test import TestCase
+
+from api.cache import recipe_list_cache
+from api.signals import PendingRecipes
+from recipes.models import DataVersion, Ingredient, IngredientsInRecipe, Recipe
+from users.models import User
+
+
+def create_user(name):
+    return User.objects.create_user(
+        username=name,
+        email=f'{name}@example.com',
+        first_name=name,
+        last_name=name,
+        password='password',
+    )
+
+
+class UsersVersionTest(TestCase):
+    """Версию 'users' меняют только поля автора в выдаче."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        Recipe.objects.create(
+            author=cls.author,
+            name='Рецепт',
+            text='Текст.',
+            cooking_time=1,
+            image='recipes/images/fake.png',
+        )
+        cls.author.refresh_from_db()
+
+    def get_version(self):
+        return DataVersion.get_versions(['users']).get('users')
+
+    def test_signup_and_password_change_keep_version(self):
+        version = self.get_version()
+        user = create_user('reader')
+        user.set_password('other-password')
+        user.save()
+        self.author.set_password('other-password')
+        self.author.save()
+        self.assertEqual(self.get_version(), version)
+
+    def test_user_without_recipes_keeps_version(self):
+        user = create_user('reader')
+        version = self.get_version()
+        user.first_name = 'Другое'
+        user.save()
+        self.assertEqual(self.get_version(), version)
+
+    def test_author_name_change_bumps_version(self):
+        version = self.get_version()
+        self.author.first_name = 'Другое'
+        self.author.save(update_fields=['first_name'])
+        self.assertNotEqual(self.get_version(), version)
+
+
+class RecipeListGenerationTest(TestCase):
+    """Общее поколение кэша списков не сбрасывается зря."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.recipe = Recipe.objects.create(
+            author=cls.author,
+            name='Рецепт',
+            text='Текст.',
+            cooking_time=1,
+            image='recipes/images/fake.png',
+        )
+        cls.ingredient = Ingredient.objects.create(
+            name='соль',
+            measurement_unit='г',
+        )
+        cls.author.refresh_from_db()
+
+    def get_generation(self):
+        return recipe_list_cache.get_generations(['global'])
+
+    def test_signup_keeps_generation(self):
+        generation = self.get_generation()
+        with self.captureOnCommitCallbacks(execute=True):
+            create_user('reader')
+        self.assertEqual(self.get_generation(), generation)
+
+    def test_author_name_change_bumps_generation(self):
+        generation = self.get_generation()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.username = 'renamed'
+            self.author.save()
+        self.assertNotEqual(self.get_generation(), generation)
+
+    def get_author_generation(self):
+        return recipe_list_cache.get_generations([f'author:{self.author.pk}'])
+
+    def test_ingredient_rows_bump_author_generation(self):
+        generation = self.get_author_generation()
+        with self.captureOnCommitCallbacks(execute=True):
+            row = IngredientsInRecipe.objects.create(
+                recipe=self.recipe,
+                ingredient=self.ingredient,
+                amount=1,
+            )
+        added = self.get_author_generation()
+        self.assertNotEqual(added, generation)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            row.amount = 2
+            row.save()
+            IngredientsInRecipe.objects.filter(pk=row.pk).delete()
+        pending = [
+            callback for callback in callbacks
+            if isinstance(callback, PendingRecipes)
+        ]
+        self.assertEqual(len(pending), 1)
+        self.assertNotEqual(self.get_author_generation(), added)
+
+    def test_metrics_include_cache_counters(self):
+        output = recipe_list_cache.render_metrics()
+        self.assertIn('foodgram_recipe_list_cache_hits_total ', output)
+        self.assertIn('foodgram_recipe_list_cache_misses_total ', output)
@@ -0,0 +1,86 @@
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from api.query_budget import QueryLog
+from recipes.models import FeedEntry, Recipe, Subscribe
+from users.models import User
+
+RECIPES = 130
+
+
+def create_user(name):
+    return User.objects.create_user(
+        username=name,
+        email=f'{name}@example.com',
+        first_name=name,
+        last_name=name,
+        password='password',
+    )
+
+
+# Лимит 0: у любого автора с подписчиками рецепты не
+# рассылаются и добираются в ленту при чтении.
+@override_settings(FEED={'FANOUT_LIMIT': 0, 'BACKFILL': 50})
+class FeedPullTest(TestCase):
+    """Чтение ленты популярного автора не пишет лишнего.
+
+    Подписка переносит в ленту последние BACKFILL рецептов,
+    чтение добирает только опубликованные после них. Когда
+    лента догнала автора, запрос ленты ничего не пишет.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.reader = create_user('reader')
+        Subscribe.objects.create(
+            user=create_user('fan'),
+            subscriber=cls.author,
+        )
+        started = timezone.now() - timedelta(days=1)
+        for number in range(RECIPES):
+            cls.create_recipe(started + timedelta(minutes=number))
+
+    @classmethod
+    def create_recipe(cls, pub_date):
+        recipe = Recipe.objects.create(
+            author=cls.author,
+            name=f'Рецепт {pub_date}',
+            text='Текст.',
+            cooking_time=1,
+            image='recipes/images/fake.png',
+        )
+        Recipe.objects.filter(pk=recipe.pk).update(pub_date=pub_date)
+        return recipe
+
+    def setUp(self):
+        token, _ = Token.objects.get_or_create(user=self.reader)
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Token {token.key}'
+
+    def read_feed(self):
+        with QueryLog() as log:
+            response = self.client.get('/api/recipes/feed/?limit=5')
+        self.assertEqual(response.status_code, 200)
+        return [
+            sql for sql, _ in log.queries
+            if not sql.lstrip().upper().startswith('SELECT')
+        ]
+
+    def test_pending_recipes_are_not_fanned_out(self):
+        self.assertFalse(Recipe.objects.filter(fanned_out=True).exists())
+
+    def test_reads_stop_writing_once_caught_up(self):
+        Subscribe.objects.create(user=self.reader, subscriber=self.author)
+        entries = FeedEntry.objects.filter(user=self.reader)
+        self.assertEqual(entries.count(), 50)
+        for _ in range(3):
+            self.assertEqual(self.read_feed(), [])
+            self.assertEqual(entries.count(), 50)
+        recipe = self.create_recipe(timezone.now())
+        self.assertTrue(self.read_feed())
+        self.assertEqual(entries.count(), 51)
+        self.assertEqual(entries.order_by('-pub_date').first().recipe, recipe)
+        self.assertEqual(self.read_feed(), [])
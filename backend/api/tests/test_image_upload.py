@@ -0,0 +1,88 @@
+import base64
+import io
+import os
+import tracemalloc
+
+from django.test import RequestFactory, SimpleTestCase
+from PIL import Image
+
+from api.fields import StreamingImageField
+
+# Фото около 6 МБ: случайные пиксели PNG не сжимает.
+IMAGE_SIDE = 1400
+# Раскодированное фото целиком в этот предел не влезает.
+PEAK_LIMIT = 2 * 1024 * 1024
+
+
+def make_large_png():
+    image = Image.frombytes(
+        'RGB',
+        (IMAGE_SIDE, IMAGE_SIDE),
+        os.urandom(IMAGE_SIDE * IMAGE_SIDE * 3),
+    )
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class StreamingImageFieldMemoryTest(SimpleTestCase):
+    """Пиковая память загрузки фото не зависит от его размера.
+
+    Тело запроса и строка base64 готовятся до начала
+    замера, так что в пик попадает только работа парсера
+    multipart и StreamingImageField.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.content = make_large_png()
+
+    def setUp(self):
+        self.field = StreamingImageField()
+
+    def measure_peak(self, function, *args):
+        tracemalloc.start()
+        try:
+            result = function(*args)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.addCleanup(result.close)
+        return result, peak
+
+    def test_size_exceeds_limit(self):
+        self.assertGreater(len(self.content), PEAK_LIMIT * 2)
+
+    def test_multipart_upload(self):
+        upload = io.BytesIO(self.content)
+        upload.name = 'photo.png'
+        request = RequestFactory().post('/api/recipes/', {'image': upload})
+
+        def parse():
+            return self.field.to_internal_value(request.FILES['image'])
+
+        image, peak = self.measure_peak(parse)
+        self.assertEqual(image.size, len(self.content))
+        self.assertTrue(image.name.endswith('.png'))
+        self.assertLess(peak, PEAK_LIMIT)
+
+    def test_base64_upload(self):
+        data = 'data:image/png;base64,' + base64.b64encode(
+            self.content,
+        ).decode()
+        image, peak = self.measure_peak(self.field.to_internal_value, data)
+        self.assertEqual(image.size, len(self.content))
+        image.seek(0)
+        self.assertEqual(image.read(64), self.content[:64])
+        self.assertLess(peak, PEAK_LIMIT)
+
+    def test_close_releases_decoded_files(self):
+        data = 'data:image/png;base64,' + base64.b64encode(
+            self.content,
+        ).decode()
+        image = self.field.to_internal_value(data)
+        self.assertFalse(image.closed)
+        self.field.close()
+        self.assertTrue(image.closed)
+        self.assertEqual(self.field.decoded, [])
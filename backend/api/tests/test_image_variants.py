@@ -0,0 +1,64 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from recipes import images
+from recipes.fake_data import make_image
+from recipes.models import Recipe
+from users.models import User
+
+
+class VariantReuseTest(TestCase):
+    """Копии одинакового фото строятся один раз."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            first_name='author',
+            last_name='author',
+            password='password',
+        )
+
+    def create_recipe(self):
+        recipe = Recipe(
+            author=self.author,
+            name='Рецепт',
+            text='Текст.',
+            cooking_time=1,
+        )
+        recipe.image.save('photo.png', make_image(1), save=False)
+        recipe.save()
+        images.generate_variants(recipe.pk, recipe.image.name)
+        recipe.refresh_from_db()
+        return recipe
+
+    def test_same_source_reuses_variants(self):
+        first = self.create_recipe()
+        with mock.patch.object(
+            images,
+            'build_variants',
+            wraps=images.build_variants,
+        ) as build_variants:
+            second = self.create_recipe()
+        build_variants.assert_not_called()
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertEqual(second.image_variants, first.image_variants)
+        for name in images.get_image_files(None, second.image_variants):
+            self.assertTrue(second.image.storage.exists(name))
@@ -0,0 +1,51 @@
+from django.test import TestCase
+
+from api.ingredient_index import ingredient_index
+from api.query_budget import QueryLog
+from recipes.models import Ingredient
+
+NAMES = ('Ёлочные грибы', 'елки-палки', 'Елка', 'Ель', 'Яблоко')
+
+
+class IngredientSearchTest(TestCase):
+    """Поиск из индекса и через фильтр отдаёт одно и то же."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г') for name in NAMES
+        )
+
+    def setUp(self):
+        ingredient_index.invalidate()
+        self.addCleanup(ingredient_index.invalidate)
+
+    def get_names(self, query):
+        response = self.client.get(f'/api/ingredients/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return [row['name'] for row in response.json()]
+
+    def test_index_and_filter_agree(self):
+        for prefix in ('Елк', 'елк', 'ЁЛ', 'е', 'нет'):
+            with self.subTest(prefix=prefix):
+                self.assertEqual(
+                    self.get_names(f'name={prefix}'),
+                    self.get_names(f'name={prefix}&x=1'),
+                )
+        self.assertEqual(
+            self.get_names('name=елк'),
+            ['Елка', 'елки-палки'],
+        )
+
+    def test_index_hit_without_queries(self):
+        self.get_names('name=ел')
+        with QueryLog() as log:
+            response = self.client.get('/api/ingredients/?name=ел')
+        self.assertEqual(len(log), 0)
+        with QueryLog() as log:
+            response = self.client.get(
+                '/api/ingredients/?name=ел',
+                HTTP_IF_NONE_MATCH=response['ETag'],
+            )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(log), 0)
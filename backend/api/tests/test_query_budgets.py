@@ -0,0 +1,319 @@
+import base64
+import shutil
+import tempfile
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test import Client, TestCase, override_settings
+from djoser.urls import authtoken
+from rest_framework.authtoken.models import Token
+
+from api.authentication import token_user_cache
+from api.catalog import ingredient_catalog
+from api.ingredient_index import ingredient_index
+from api.query_budget import QueryLog
+from api.urls import router_v1
+from recipes.fake_data import FakeDataGenerator, make_image
+from recipes.images import IMAGE_LOCK_KEY
+from recipes.models import DataVersion, Ingredient, Recipe, Subscribe, Tag
+from users.models import User
+
+SEED = 42
+
+QueryCase = namedtuple(
+    'QueryCase',
+    ('route', 'method', 'path', 'budget', 'status', 'auth', 'data', 'save'),
+    defaults=('user', None, None),
+)
+
+
+def recipe_data(context):
+    return {
+        'name': f'Проверка {context["limit"]}',
+        'text': 'Проверка бюджета запросов.',
+        'cooking_time': 10,
+        'image': context['image'],
+        'tags': context['tag_ids'],
+        'ingredients': [
+            {'id': ingredient_id, 'amount': 10}
+            for ingredient_id in context['ingredient_ids']
+        ],
+    }
+
+
+# Порядок важен: случаи выполняются подряд, POST и DELETE
+# идут парами, а PATCH и DELETE рецепта работают с рецептом,
+# созданным POST.
+CASES = (
+    QueryCase('api-root', 'get', '/api/', 1, 200),
+    QueryCase('user-list', 'get', '/api/users/?limit={limit}', 4, 200),
+    QueryCase(
+        'user-list', 'post', '/api/users/', 8, 201, 'anonymous',
+        lambda context: {
+            'email': f'budget{context["limit"]}@example.com',
+            'username': f'budget{context["limit"]}',
+            'first_name': 'Бюджет',
+            'last_name': 'Запросов',
+            'password': context['password'],
+        },
+    ),
+    QueryCase('user-detail', 'get', '/api/users/{other_id}/', 3, 200),
+    QueryCase('user-me', 'get', '/api/users/me/', 2, 200),
+    QueryCase(
+        'user-subscriptions', 'get',
+        '/api/users/subscriptions/?limit={limit}&recipes_limit=3', 5, 200,
+    ),
+    QueryCase(
+        'user-subscribe', 'post', '/api/users/{author_id}/subscribe/',
+        7, 201,
+    ),
+    QueryCase(
+        'user-subscribe', 'delete', '/api/users/{author_id}/subscribe/',
+        7, 204,
+    ),
+    QueryCase('tag-list', 'get', '/api/tags/', 2, 200, 'anonymous'),
+    QueryCase('tag-detail', 'get', '/api/tags/{tag_id}/', 1, 200, 'anonymous'),
+    QueryCase('ingredient-list', 'get', '/api/ingredients/', 2, 200,
+              'anonymous'),
+    QueryCase('ingredient-list', 'get', '/api/ingredients/?name={prefix}',
+              2, 200, 'anonymous'),
+    QueryCase('ingredient-detail', 'get', '/api/ingredients/{ingredient_id}/',
+              1, 200, 'anonymous'),
+    QueryCase('recipe-list', 'get', '/api/recipes/?limit={limit}', 6, 200,
+              'anonymous'),
+    QueryCase('recipe-list', 'get', '/api/recipes/?limit={limit}', 8, 200),
+    QueryCase('recipe-list', 'post', '/api/recipes/', 28, 201, 'user',
+              recipe_data, ('new_recipe_id', 'id')),
+    QueryCase('recipe-detail', 'get', '/api/recipes/{recipe_id}/', 6, 200),
+    QueryCase('recipe-detail', 'patch', '/api/recipes/{new_recipe_id}/',
+              20, 200, 'user', recipe_data),
+    QueryCase('recipe-detail', 'delete', '/api/recipes/{new_recipe_id}/',
+              18, 204),
+    QueryCase('recipe-favorite', 'post', '/api/recipes/{recipe_id}/favorite/',
+              9, 201),
+    QueryCase('recipe-favorite', 'delete',
+              '/api/recipes/{recipe_id}/favorite/', 5, 204),
+    QueryCase('recipe-shopping_cart', 'post',
+              '/api/recipes/{recipe_id}/shopping_cart/', 14, 201),
+    QueryCase('recipe-shopping_cart', 'delete',
+              '/api/recipes/{recipe_id}/shopping_cart/', 10, 204),
+    QueryCase('recipe-feed', 'get', '/api/recipes/feed/?limit={limit}',
+              8, 200),
+    QueryCase('recipe-download_shopping_cart', 'get',
+              '/api/recipes/download_shopping_cart/', 4, 200),
+    QueryCase(
+        'user-set-password', 'post', '/api/users/set_password/', 5, 204,
+        'user',
+        lambda context: {
+            'current_password': context['password'],
+            'new_password': context['password'],
+        },
+    ),
+    QueryCase(
+        'user-set-username', 'post', '/api/users/set_email/', 7, 204,
+        'user',
+        lambda context: {
+            'current_password': context['password'],
+            'new_email': f'renamed{context["limit"]}@example.com',
+        },
+    ),
+    QueryCase(
+        'user-activation', 'post', '/api/users/activation/', 0, 400,
+        'anonymous', lambda context: {'uid': 'x', 'token': 'x'},
+    ),
+    QueryCase(
+        'user-resend-activation', 'post', '/api/users/resend_activation/',
+        1, 400, 'anonymous', lambda context: {'email': context['email']},
+    ),
+    QueryCase(
+        'user-reset-password', 'post', '/api/users/reset_password/',
+        1, 204, 'anonymous', lambda context: {'email': 'missing@example.com'},
+    ),
+    QueryCase(
+        'user-reset-password-confirm', 'post',
+        '/api/users/reset_password_confirm/', 0, 400, 'anonymous',
+        lambda context: {
+            'uid': 'x',
+            'token': 'x',
+            'new_password': context['password'],
+        },
+    ),
+    QueryCase(
+        'user-reset-username', 'post', '/api/users/reset_email/',
+        1, 204, 'anonymous', lambda context: {'email': 'missing@example.com'},
+    ),
+    QueryCase(
+        'user-reset-username-confirm', 'post',
+        '/api/users/reset_email_confirm/', 1, 400, 'anonymous',
+        lambda context: {
+            'uid': 'x',
+            'token': 'x',
+            'new_email': 'confirm@example.com',
+        },
+    ),
+    QueryCase(
+        'login', 'post', '/api/auth/token/login/', 4, 200, 'anonymous',
+        lambda context: {
+            'email': context['email'],
+            'password': context['password'],
+        },
+        ('auth_token', 'auth_token'),
+    ),
+    QueryCase('logout', 'post', '/api/auth/token/logout/', 3, 204, 'login'),
+)
+
+
+def get_route_names():
+    names = {pattern.name for pattern in router_v1.urls}
+    names.update(pattern.name for pattern in authtoken.urlpatterns)
+    return names
+
+
+def reset_caches():
+    """Сбрасывает кэши, чтобы мерить запросы с холодного старта."""
+    for cache in caches.all():
+        cache.clear()
+    token_user_cache.clear()
+    ingredient_index.invalidate()
+    ingredient_catalog.clear()
+
+
+def get_context(seed):
+    FakeDataGenerator(
+        seed=seed,
+        users=200,
+        recipes=1000,
+        ingredients=500,
+    ).generate()
+    # Самый активный пользователь: у него больше всего
+    # подписок, так что страница в 50 авторов заполнена.
+    user_ids = list(Subscribe.objects.values_list('user_id', flat=True))
+    user = User.objects.get(id=max(set(user_ids), key=user_ids.count))
+    other = User.objects.exclude(id=user.id).order_by('id').first()
+    followed = user.subscribe.values('subscriber_id')
+    author = User.objects.exclude(id=user.id).exclude(
+        id__in=followed,
+    ).order_by('id').first()
+    recipe = Recipe.objects.exclude(author=user).exclude(
+        favorite_recipe__user=user,
+    ).exclude(
+        shopping_cart__user=user,
+    ).order_by('id').first()
+    # Строки версий создаются при первой записи, бюджеты
+    # считаются для уже активного пользователя.
+    DataVersion.bump(
+        f'favorites:{user.id}',
+        f'shopping_cart:{user.id}',
+        f'subscriptions:{user.id}',
+    )
+    DataVersion.objects.get_or_create(key=IMAGE_LOCK_KEY)
+    return {
+        'user': user,
+        'password': f'fake-password-{seed}',
+        'email': other.email,
+        'other_id': other.id,
+        'author_id': author.id,
+        'recipe_id': recipe.id,
+        'tag_id': Tag.objects.order_by('id').first().id,
+        'tag_ids': list(
+            Tag.objects.order_by('id').values_list('id', flat=True)[:2],
+        ),
+        'ingredient_id': Ingredient.objects.order_by('id').first().id,
+        'ingredient_ids': list(
+            Ingredient.objects.order_by('id').values_list(
+                'id',
+                flat=True,
+            )[:5],
+        ),
+        'prefix': Ingredient.objects.order_by('id').first().name[:2],
+        'image': 'data:image/png;base64,' + base64.b64encode(
+            make_image(seed).read(),
+        ).decode(),
+    }
+
+
+# Уменьшенные копии фото строятся синхронно, чтобы их
+# запросы честно входили в бюджет создания рецепта.
+@override_settings(
+    REQUEST_METRICS={'ENABLED': False},
+    RECIPE_IMAGE_VARIANTS=dict(settings.RECIPE_IMAGE_VARIANTS, ASYNC=False),
+)
+class QueryBudgetTest(TestCase):
+    """Бюджеты SQL-запросов эндпоинтов API.
+
+    Каждый маршрут router_v1 и djoser (включая токены)
+    вызывается на страницах размером 1 и 50 на данных
+    FakeDataGenerator. Кэши перед каждым запросом
+    сбрасываются. Если запросов больше бюджета из CASES,
+    в ошибке печатаются повторяющиеся SQL по местам
+    вызова. Маршрут без бюджета - тоже ошибка, так что
+    новые эндпоинты не пройдут незамеченными.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.context = get_context(SEED)
+
+    def get_client(self, case, context):
+        if case.auth == 'anonymous':
+            return Client()
+        if case.auth == 'login':
+            key = context['auth_token']
+        else:
+            key, _ = Token.objects.get_or_create(user=context['user'])
+        return Client(HTTP_AUTHORIZATION=f'Token {key}')
+
+    def check_case(self, case, context):
+        client = self.get_client(case, context)
+        path = case.path.format(**context)
+        data = case.data(context) if case.data else None
+        label = f'{case.method.upper()} {path}'
+        reset_caches()
+        with QueryLog() as log:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = getattr(client, case.method)(
+                    path,
+                    data,
+                    content_type='application/json',
+                )
+                if response.streaming:
+                    b''.join(response.streaming_content)
+        if response.status_code != case.status:
+            self.fail(
+                f'{label}: статус {response.status_code} вместо '
+                f'{case.status}: {response.content.decode()[:500]}',
+            )
+        if case.save:
+            key, field = case.save
+            context[key] = response.json()[field]
+        log.check_budget(case.budget, label)
+
+    def check_cases(self, limit):
+        context = dict(self.context, limit=limit)
+        for case in CASES:
+            with self.subTest(case.method.upper(), path=case.path):
+                self.check_case(case, context)
+
+    def test_every_route_has_budget(self):
+        missing = get_route_names() - {case.route for case in CASES}
+        self.assertFalse(missing, 'Нет бюджета для маршрутов.')
+
+    def test_page_size_1(self):
+        self.check_cases(1)
+
+    def test_page_size_50(self):
+        self.check_cases(50)
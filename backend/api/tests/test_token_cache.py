@@ -0,0 +1,40 @@
+from django.test import SimpleTestCase, override_settings
+
+from api.authentication import token_user_cache
+from api.checks import check_token_auth_cache
+
+LOCAL = {'ENABLED': True, 'ALIAS': None, 'WORKERS': 2}
+SHARED = {'ENABLED': True, 'ALIAS': 'shared', 'WORKERS': 2}
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    },
+}
+
+
+@override_settings(CACHES=CACHES)
+class TokenCacheWorkersTest(SimpleTestCase):
+    """Несколько воркеров без общего кэша не кэшируют токены."""
+
+    @override_settings(TOKEN_AUTH_CACHE={**LOCAL, 'WORKERS': 1})
+    def test_single_worker_uses_local_cache(self):
+        self.assertTrue(token_user_cache.enabled)
+        self.assertEqual(check_token_auth_cache(None), [])
+
+    @override_settings(TOKEN_AUTH_CACHE=LOCAL)
+    def test_workers_without_shared_cache_disable_it(self):
+        self.assertFalse(token_user_cache.enabled)
+        errors = check_token_auth_cache(None)
+        self.assertEqual([error.id for error in errors], ['api.W001'])
+
+    @override_settings(TOKEN_AUTH_CACHE={**LOCAL, 'ALIAS': 'default'})
+    def test_locmem_alias_is_not_shared(self):
+        self.assertFalse(token_user_cache.enabled)
+
+    @override_settings(TOKEN_AUTH_CACHE=SHARED)
+    def test_workers_with_shared_cache(self):
+        self.assertTrue(token_user_cache.enabled)
+        self.assertEqual(check_token_auth_cache(None), [])
@@ -2,8 +2,8 @@ from django.conf.urls import url
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from api.views import (IngredientViewSet, RecipeViewSet, TagViewSet,
-                       UsersViewSet)
+from api.views import (IngredientViewSet, MetricsView, RecipeViewSet,
+                       TagViewSet, UsersViewSet)
 
 app_name = 'api'
 
@@ -15,6 +15,7 @@ router_v1.register(r'recipes', RecipeViewSet)
 
 
 urlpatterns = [
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('', include(router_v1.urls)),
     url(r'^auth/', include('djoser.urls')),
     url(r'^auth/', include('djoser.urls.authtoken')),
@@ -1,25 +1,36 @@
-from django.db.models.aggregates import Count, Sum
-from django.http import HttpResponse
+from django.db.models import Exists, OuterRef, Prefetch, Subquery
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
+from api.cache import recipe_list_cache
+from api.catalog import ingredient_catalog
+from api.exports import ShoppingListExport
 from api.filters import IngredientsFilter, RecipesFilter
-from api.pagination import PageLimitPagination
+from api.ingredient_index import ingredient_index
+from api.metrics import measure_serializer, metrics_registry
+from api.mixins import (AnonymousListCacheMixin, ConditionalListMixin,
+                        PrefixIndexListMixin, SerializerTimingMixin,
+                        SnapshotListMixin)
+from api.pagination import FeedPagination, RecipePagination, UserPagination
 from api.permissions import AdminAuthorOrReadOnly, AdminOrReadOnly
+from api.renderers import (PrometheusRenderer, ShoppingListCSVRenderer,
+                           ShoppingListJSONRenderer, ShoppingListTextRenderer)
 from api.serializers import (FavoriteShoppingCartSerializer,
                              IngredientSerializer, RecipeAddSerializer,
-                             RecipeReadSeriaizer, SubscribeSerializer,
-                             SubscriptionSerializer, TagSerializer)
+                             RecipeDetailSerializer, RecipeReadSeriaizer,
+                             SubscribeSerializer, SubscriptionSerializer,
+                             TagSerializer)
 from core.utils import shopcart_or_favorite
-from recipes.models import (FavoriteRecipes, Ingredient, IngredientsInRecipe,
-                            Recipe, ShoppingCart, Subscribe, Tag, User)
+from recipes.models import (FavoriteRecipes, FeedEntry, Ingredient, Recipe,
+                            ShoppingCart, Subscribe, Tag, User)
 
 
-class UsersViewSet(UserViewSet):
+class UsersViewSet(SerializerTimingMixin, UserViewSet):
     """Вьюсет пользователей.
 
     def me:
@@ -29,11 +40,13 @@ class UsersViewSet(UserViewSet):
         Подписаться на себя нельзя.
     def subscriptions:
         Получить на кого подписан пользователь.
+        Рецепты авторов страницы, не больше recipes_limit
+        на автора, подгружаются одним запросом.
     def perfom_create:
         Переопредления базового метода для
         создания пользователя и изменения пароля.
     """
-    pagination_class = PageLimitPagination
+    pagination_class = UserPagination
 
     @action(
         detail=False,
@@ -69,10 +82,10 @@ class UsersViewSet(UserViewSet):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
             subscriber = Subscribe.objects.create(user=user, subscriber=author)
-            serializer = SubscribeSerializer(
+            serializer = measure_serializer(SubscribeSerializer(
                 subscriber,
                 context={'request': request},
-            )
+            ))
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         user = request.user
         author = get_object_or_404(User, id=id)
@@ -99,36 +112,78 @@ class UsersViewSet(UserViewSet):
     def subscriptions(self, request):
         subscribers = User.objects.filter(
             id__in=request.user.subscribe.all().values('subscriber_id'),
-        ).annotate(recipes_count=Count('recipes'))
+        ).prefetch_related(
+            Prefetch(
+                'recipes',
+                queryset=self.get_subscription_recipes(request),
+            ),
+        ).order_by('id')
         pages = self.paginate_queryset(subscribers)
-        serializer = SubscriptionSerializer(
+        serializer = measure_serializer(SubscriptionSerializer(
             many=True,
             instance=pages,
             context={
                 'request': request,
             },
-        )
+        ))
         return self.get_paginated_response(serializer.data)
 
+    def get_subscription_recipes(self, request):
+        recipes = Recipe.objects.order_by('-pub_date', '-id')
+        try:
+            limit = int(request.query_params.get('recipes_limit'))
+        except (TypeError, ValueError):
+            return recipes
+        if limit < 1:
+            return recipes
+        return recipes.filter(
+            id__in=Subquery(
+                Recipe.objects.filter(
+                    author_id=OuterRef('author_id'),
+                ).order_by('-pub_date', '-id').values('id')[:limit],
+            ),
+        )
+
     def perform_create(self, serializer):
         instance = serializer.save()
         instance.set_password(instance.password)
         instance.save()
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(
+    SerializerTimingMixin,
+    ConditionalListMixin,
+    viewsets.ModelViewSet,
+):
     """Вьюсет для модели тэгов.
 
     Изменение и создание тэгов разрешено только админам.
+    Список отдаётся с ETag по версии таблицы тегов.
     """
+    version_keys = ('tags',)
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AdminOrReadOnly,)
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
-    """Вьюсет для модели ингредиентов."""
+class IngredientViewSet(
+    SerializerTimingMixin,
+    SnapshotListMixin,
+    PrefixIndexListMixin,
+    ConditionalListMixin,
+    viewsets.ModelViewSet,
+):
+    """Вьюсет для модели ингредиентов.
+
+    Полный каталог отдаётся из сжатого снимка ingredient_catalog,
+    поиск по началу названия - из ingredient_index без запросов
+    к базе, остальные списки - с ETag по версии таблицы
+    ингредиентов.
+    """
+    version_keys = ('ingredients',)
+    prefix_index = ingredient_index
+    snapshot = ingredient_catalog
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (AdminOrReadOnly,)
@@ -137,30 +192,82 @@ class IngredientViewSet(viewsets.ModelViewSet):
     search_fields = ('^name',)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+    SerializerTimingMixin,
+    ConditionalListMixin,
+    AnonymousListCacheMixin,
+    viewsets.ModelViewSet,
+):
     """"Отображение рецептов.
 
+    Список отдаётся с ETag и Last-Modified: по версиям
+    рецептов, тегов, ингредиентов, пользователей и версиям
+    избранного, списка покупок и подписок текущего
+    пользователя. Версию рецептов увеличивают сигналы
+    сохранения и удаления рецепта.
+    Страницы списка для анонимов кэшируются в recipe_list_cache
+    и сбрасываются сигналами из api.signals.
+
+    def get_queryset:
+        Подгружает автора, теги и ингредиенты заранее
+        и аннотирует флаги избранного и списка покупок
+        для текущего пользователя, чтобы число запросов
+        не зависело от размера страницы.
     def get_serializer_class:
         В зависимости от запроса возвращает
-        сериализатор создания или чтение рецепта.
+        сериализатор создания, чтения или страницы рецепта.
     def favorite:
         Добавить или убрать рецепт из избранного.
     def shopping_cart:
         Добавление или удаление рецепта из
         спика покупок.
+    def feed:
+        Лента рецептов авторов, на которых подписан
+        пользователь, с курсорной пагинацией.
     def download_shopping_cart:
         Скачать список игредиентов для рецептов
         добавленных в список покупок.
+        Формат выбирается через ?format=txt|csv|json.
     """
 
+    version_keys = ('recipes', 'tags', 'ingredients', 'users')
+    user_version_keys = ('favorites', 'shopping_cart', 'subscriptions')
+    list_cache = recipe_list_cache
     queryset = Recipe.objects.all()
     permission_classes = (AdminAuthorOrReadOnly,)
-    pagination_class = PageLimitPagination
+    pagination_class = RecipePagination
     filterset_class = RecipesFilter
 
+    def get_queryset(self):
+        queryset = Recipe.objects.select_related(
+            'author',
+        ).prefetch_related(
+            'tags',
+            'ingredients_recipe__ingredient',
+        )
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset
+        return queryset.annotate(
+            favorited=Exists(
+                FavoriteRecipes.objects.filter(
+                    user=user,
+                    recipe=OuterRef('pk'),
+                ),
+            ),
+            in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(
+                    user=user,
+                    recipe=OuterRef('pk'),
+                ),
+            ),
+        )
+
     def get_serializer_class(self):
         if self.request.method in ['POST', 'PATCH']:
             return RecipeAddSerializer
+        if self.action == 'retrieve':
+            return RecipeDetailSerializer
         return RecipeReadSeriaizer
 
     @action(
@@ -195,32 +302,53 @@ class RecipeViewSet(viewsets.ModelViewSet):
             pk,
         )
 
+    @action(
+        methods=['GET'],
+        detail=False,
+        url_name='feed',
+        url_path='feed',
+        permission_classes=(IsAuthenticated,),
+        pagination_class=FeedPagination,
+    )
+    def feed(self, request):
+        entries = self.paginate_queryset(FeedEntry.get_feed(request.user))
+        serializer = measure_serializer(RecipeReadSeriaizer(
+            FeedEntry.get_recipes(entries, self.get_queryset()),
+            many=True,
+            context=self.get_serializer_context(),
+        ))
+        return self.get_paginated_response(serializer.data)
+
     @action(
         methods=['GET'],
         detail=False,
         url_name='download_shopping_cart',
         url_path='download_shopping_cart',
         permission_classes=(IsAuthenticated,),
+        renderer_classes=(
+            ShoppingListTextRenderer,
+            ShoppingListCSVRenderer,
+            ShoppingListJSONRenderer,
+        ),
     )
     def download_shopping_cart(self, request):
-        ingredients = IngredientsInRecipe.objects.filter(
-            recipe__shopping_cart__user=request.user,
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit',
-        ).annotate(
-            total=Sum('amount'),
-        ).order_by()
-        shopping_list = []
-        for ingredient in ingredients:
-            shopping_list.append(
-                f'{ingredient["ingredient__name"]}-{ingredient["total"]},'
-                f'{ingredient["ingredient__measurement_unit"]}\n',
-            )
-        shopping_list_text = ''.join(shopping_list)
-        response = HttpResponse(content_type='text/plain')
-        response[
-            'Content-Disposition'
-        ] = 'attachment; filename="shopping_list.txt"'
-        response.write(shopping_list_text)
-        return response
+        return ShoppingListExport(
+            request,
+            request.accepted_renderer.format,
+        ).get_response()
+
+
+class MetricsView(APIView):
+    """Гистограммы RequestMetricsMiddleware в формате Prometheus.
+
+    К ним добавлены счётчики попаданий и промахов
+    recipe_list_cache. Доступно только персоналу.
+    """
+    permission_classes = (IsAdminUser,)
+    renderer_classes = (PrometheusRenderer,)
+
+    def get(self, request):
+        return Response(
+            metrics_registry.render() + recipe_list_cache.render_metrics(),
+            content_type='text/plain; version=0.0.4; charset=utf-8',
+        )
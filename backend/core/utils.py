@@ -1,8 +1,12 @@
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from rest_framework import status
 from rest_framework.response import Response
 
+from recipes.models import Subscribe
 
+
+@transaction.atomic
 def shopcart_or_favorite(self, request, model, serializer, pk):
     if request.method == 'POST':
         user = request.user
@@ -32,3 +36,21 @@ def shopcart_or_favorite(self, request, model, serializer, pk):
     return Response(
         status=status.HTTP_204_NO_CONTENT,
     )
+
+
+def get_subscribed_ids(request):
+    """Множество id авторов, на которых подписан пользователь.
+
+    Загружается один раз за запрос и запоминается на объекте
+    запроса, поэтому все сериализаторы, вкладывающие
+    пользователя, проверяют подписку без обращения к базе.
+    """
+    subscribed_ids = getattr(request, '_subscribed_ids', None)
+    if subscribed_ids is None:
+        subscribed_ids = set(
+            Subscribe.objects.filter(
+                user=request.user,
+            ).values_list('subscriber_id', flat=True).order_by(),
+        )
+        request._subscribed_ids = subscribed_ids
+    return subscribed_ids
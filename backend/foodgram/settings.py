@@ -35,6 +35,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -93,6 +94,73 @@ DATABASES = {
     },
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            default='foodgram',
+        ),
+    },
+}
+
+RECIPE_LIST_CACHE = {
+    'ENABLED': os.getenv('RECIPE_LIST_CACHE_ENABLED', default='1') == '1',
+    'ALIAS': 'default',
+    'TIMEOUT': int(os.getenv('RECIPE_LIST_CACHE_TIMEOUT', default=60)),
+}
+
+SHOPPING_LIST_CACHE = {
+    'ALIAS': 'default',
+    'MAX_SIZE': 256 * 1024,
+    'TIMEOUT': 600,
+}
+
+REQUEST_METRICS = {
+    'ENABLED': os.getenv('REQUEST_METRICS_ENABLED', default='1') == '1',
+    'SAMPLE_RATE': float(os.getenv('REQUEST_METRICS_SAMPLE_RATE', default=0.1)),
+    'SERVER_TIMING': os.getenv('SERVER_TIMING', default='0') == '1',
+}
+
+TOKEN_AUTH_CACHE = {
+    'ENABLED': os.getenv('TOKEN_AUTH_CACHE_ENABLED', default='1') == '1',
+    'ALIAS': os.getenv('TOKEN_AUTH_CACHE_ALIAS'),
+    'MAX_SIZE': 1024,
+    'TIMEOUT': int(os.getenv('TOKEN_AUTH_CACHE_TIMEOUT', default=30)),
+    # Число воркеров gunicorn: он читает ту же переменную.
+    # Больше одного воркера - кэш работает только с общим ALIAS.
+    'WORKERS': int(os.getenv('WEB_CONCURRENCY', default=1)),
+}
+
+RECIPE_IMAGE_STORAGE = {
+    'SHARD_DEPTH': 2,
+    'SHARD_WIDTH': 2,
+}
+
+RECIPE_IMAGE_VARIANTS = {
+    'ASYNC': True,
+    'WORKERS': 2,
+    'SIZES': {
+        'list': (320, 320, True),
+        'card': (640, 640, True),
+        'detail': (1280, 1280, False),
+    },
+}
+
+FEED = {
+    'FANOUT_LIMIT': 1000,
+    'BACKFILL': 50,
+}
+
+INGREDIENT_INDEX = {
+    'ENABLED': True,
+    'LIMIT': 50,
+    'VERSION_CHECK_INTERVAL': 5,
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -142,6 +210,8 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 DATA_UPLOAD_MAX_MEMORY_SIZE = 20971520
 
+FILE_UPLOAD_MAX_MEMORY_SIZE = 262144
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
@@ -149,7 +219,16 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -2,7 +2,8 @@ from django.contrib import admin
 from django.utils.html import format_html
 
 from recipes.models import (FavoriteRecipes, Ingredient, IngredientsInRecipe,
-                            Recipe, ShoppingCart, Subscribe, Tag)
+                            Recipe, ShoppingCart, ShoppingListItem, Subscribe,
+                            Tag)
 
 
 class IngredientsInRecipeAdmin(admin.StackedInline):
@@ -55,9 +56,16 @@ class RecipeAdmin(admin.ModelAdmin):
     inlines = (IngredientsInRecipeAdmin,)
     empty_value_display = '-пусто'
 
-    @admin.display(description='Число добавлений в избранное')
+    @admin.display(
+        description='Число добавлений в избранное',
+        ordering='favorites_count',
+    )
     def get_favorites(self, data):
-        return data.favorite_recipe.count()
+        return data.favorites_count
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        ShoppingListItem.refresh_for_recipe(form.instance.id)
 
 
 @admin.register(Ingredient)
@@ -0,0 +1,356 @@
+import io
+import os
+import random
+import tempfile
+from contextlib import contextmanager, nullcontext
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import (DEFAULT_DB_ALIAS, OperationalError, connection,
+                       connections, transaction)
+from django.test.utils import (override_settings, setup_databases,
+                               setup_test_environment, teardown_databases,
+                               teardown_test_environment)
+from PIL import Image
+
+from recipes.models import (DataVersion, FavoriteRecipes, FeedEntry,
+                            Ingredient, IngredientsInRecipe, Recipe,
+                            ShoppingCart, Subscribe, Tag)
+from users.models import User
+
+WORDS = (
+    'абрикос', 'базилик', 'баклажан', 'говядина', 'горчица', 'гречка',
+    'изюм', 'имбирь', 'индейка', 'капуста', 'картофель', 'кинза',
+    'лук', 'майонез', 'масло', 'мука', 'огурец', 'перец', 'петрушка',
+    'помидор', 'рис', 'сахар', 'сливки', 'сметана', 'соль', 'сыр',
+    'творог', 'тыква', 'укроп', 'форель', 'чеснок', 'яблоко', 'яйцо',
+)
+UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.', 'по вкусу')
+
+
+def make_image(seed):
+    buffer = io.BytesIO()
+    Image.new(
+        'RGB',
+        (64, 64),
+        (seed * 37 % 256, seed * 91 % 256, seed * 53 % 256),
+    ).save(buffer, 'PNG')
+    return ContentFile(buffer.getvalue())
+
+
+def database_available():
+    """Можно ли подключиться к базе default из настроек."""
+    try:
+        connection.ensure_connection()
+    except (ImproperlyConfigured, OperationalError):
+        return False
+    connection.close()
+    return True
+
+
+@contextmanager
+def sqlite_database():
+    """Подменяет базу default на SQLite в памяти.
+
+    Нужно, когда PostgreSQL из настроек недоступен, например
+    при запуске вне docker-compose.
+    """
+    settings_dict = connections.databases[DEFAULT_DB_ALIAS]
+    saved = dict(settings_dict)
+    connection.close()
+    settings_dict.update(
+        ENGINE='django.db.backends.sqlite3',
+        NAME=':memory:',
+        USER='',
+        PASSWORD='',
+        HOST='',
+        PORT='',
+        OPTIONS={},
+        TEST={**saved['TEST'], 'NAME': None},
+    )
+    del connections[DEFAULT_DB_ALIAS]
+    try:
+        yield
+    finally:
+        connection.close()
+        settings_dict.clear()
+        settings_dict.update(saved)
+        del connections[DEFAULT_DB_ALIAS]
+
+
+@contextmanager
+def test_environment(keepdb=False, sqlite=False):
+    """Тестовая база и временный MEDIA_ROOT для замеров.
+
+    База создаётся как в manage.py test (с sqlite - SQLite
+    в памяти вместо базы из настроек), замеры запросов
+    RequestMetricsMiddleware отключены.
+    """
+    with tempfile.TemporaryDirectory() as media_root:
+        with override_settings(
+            MEDIA_ROOT=media_root,
+            REQUEST_METRICS={'ENABLED': False},
+        ), sqlite_database() if sqlite else nullcontext():
+            setup_test_environment()
+            old_config = setup_databases(
+                verbosity=0,
+                interactive=False,
+                keepdb=keepdb,
+            )
+            try:
+                yield
+            finally:
+                teardown_databases(old_config, verbosity=0, keepdb=keepdb)
+                teardown_test_environment()
+
+
+class FakeDataGenerator:
+    """Детерминированные тестовые данные.
+
+    Одинаковые seed и размеры дают одинаковые данные,
+    поэтому замеры на них можно сравнивать между запусками.
+
+    Распределения скошены по Ципфу с показателем skew
+    (0 - равномерно): немногие авторы пишут много рецептов
+    и собирают большую часть подписчиков, немногие рецепты
+    попадают в избранное и списки покупок чаще остальных,
+    соль и сахар встречаются почти в каждом рецепте.
+    Активность пользователей скошена так же.
+
+    Всё пишется через bulk_create пачками по batch_size
+    в одной транзакции, сигналы при этом не срабатывают,
+    так что счётчики и сводные списки покупок
+    пересобираются командами reconcile_counters и
+    rebuild_shopping_lists.
+
+    Всем рецептам достаётся одно фото - хранилище по хэшу
+    хранит его одним файлом.
+    """
+
+    def __init__(self, seed=42, users=100, recipes=500, ingredients=1000,
+                 tags=10, ingredients_per_recipe=8, favorites=None,
+                 carts=None, subscriptions=None, skew=1.0,
+                 batch_size=1000, log=None):
+        self.random = random.Random(seed)
+        self.seed = seed
+        self.counts = {
+            'users': users,
+            'recipes': recipes,
+            'ingredients': ingredients,
+            'tags': tags,
+            'favorites': users * 10 if favorites is None else favorites,
+            'carts': users * 5 if carts is None else carts,
+            'subscriptions': (
+                users * 5 if subscriptions is None else subscriptions
+            ),
+        }
+        self.ingredients_per_recipe = ingredients_per_recipe
+        self.skew = skew
+        self.batch_size = batch_size
+        self.log = log or (lambda message: None)
+
+    def insert(self, model, objects, return_ids=False):
+        """Вставляет объекты пачками, по запросу возвращает их id."""
+        objects = iter(objects)
+        inserted = 0
+        while True:
+            batch = list(islice(objects, self.batch_size))
+            if not batch:
+                break
+            model.objects.bulk_create(batch)
+            inserted += len(batch)
+        self.log(f'{model._meta.verbose_name_plural}: {inserted}')
+        if not return_ids:
+            return None
+        # SQLite в Django 3.2 не возвращает id из bulk_create,
+        # поэтому берём последние вставленные строки.
+        return list(
+            model.objects.order_by('-id').values_list(
+                'id',
+                flat=True,
+            )[:inserted],
+        )[::-1]
+
+    def get_weights(self, size):
+        """Накопленные веса Ципфа в случайном порядке рангов."""
+        weights = [1 / rank ** self.skew for rank in range(1, size + 1)]
+        self.random.shuffle(weights)
+        return list(accumulate(weights))
+
+    def choose(self, ids, weights, count):
+        return self.random.choices(ids, cum_weights=weights, k=count)
+
+    def choose_unique(self, ids, weights, count):
+        count = min(count, len(ids))
+        chosen = []
+        seen = set()
+        while len(chosen) < count:
+            for pk in self.choose(ids, weights, count - len(chosen)):
+                if pk not in seen:
+                    seen.add(pk)
+                    chosen.append(pk)
+        return chosen
+
+    def choose_pairs(self, left_ids, left_weights, right_ids,
+                     right_weights, total, exclude_same=False):
+        """Уникальные пары (левый, правый) со скошенными весами."""
+        possible = len(left_ids) * len(right_ids)
+        if exclude_same:
+            possible -= len(set(left_ids) & set(right_ids))
+        total = min(total, possible)
+        seen = set()
+        while len(seen) < total:
+            need = total - len(seen)
+            for pair in zip(
+                self.choose(left_ids, left_weights, need),
+                self.choose(right_ids, right_weights, need),
+            ):
+                if exclude_same and pair[0] == pair[1]:
+                    continue
+                if pair not in seen:
+                    seen.add(pair)
+                    yield pair
+
+    def create_tags(self):
+        return self.insert(Tag, (
+            Tag(
+                name=f'Тег {self.seed}-{number}',
+                color=f'#{(self.seed * 7919 + number) % 0xFFFFFF:06X}',
+                slug=f'tag-{self.seed}-{number}',
+            )
+            for number in range(self.counts['tags'])
+        ), return_ids=True)
+
+    def create_ingredients(self):
+        return self.insert(Ingredient, (
+            Ingredient(
+                name=f'{WORDS[number % len(WORDS)]} {self.seed}-{number}',
+                measurement_unit=UNITS[number % len(UNITS)],
+            )
+            for number in range(self.counts['ingredients'])
+        ), return_ids=True)
+
+    def create_users(self):
+        password = make_password(f'fake-password-{self.seed}')
+        return self.insert(User, (
+            User(
+                username=f'fake{self.seed}_{number}',
+                email=f'fake{self.seed}_{number}@example.com',
+                first_name='Пользователь',
+                last_name=str(number),
+                password=password,
+            )
+            for number in range(self.counts['users'])
+        ), return_ids=True)
+
+    def create_recipes(self, author_ids, author_weights, image):
+        return self.insert(Recipe, (
+            Recipe(
+                author_id=author_id,
+                name=f'Рецепт {self.seed}-{number}',
+                text='Смешать и подавать.',
+                image=image,
+                cooking_time=self.random.randint(5, 180),
+            )
+            for number, author_id in enumerate(self.choose(
+                author_ids,
+                author_weights,
+                self.counts['recipes'],
+            ))
+        ), return_ids=True)
+
+    def create_recipe_relations(self, recipe_ids, ingredient_ids, tag_ids):
+        ingredient_weights = self.get_weights(len(ingredient_ids))
+        low = max(1, self.ingredients_per_recipe // 2)
+        high = max(low, self.ingredients_per_recipe * 3 // 2)
+        self.insert(IngredientsInRecipe, (
+            IngredientsInRecipe(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=self.random.randint(1, 500),
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in self.choose_unique(
+                ingredient_ids,
+                ingredient_weights,
+                self.random.randint(low, high),
+            )
+        ))
+        tag_weights = self.get_weights(len(tag_ids))
+        self.insert(Recipe.tags.through, (
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in self.choose_unique(
+                tag_ids,
+                tag_weights,
+                self.random.randint(1, 3),
+            )
+        ))
+
+    def create_user_relations(self, user_ids, author_weights, recipe_ids):
+        activity = self.get_weights(len(user_ids))
+        popularity = self.get_weights(len(recipe_ids))
+        for model, count in (
+            (FavoriteRecipes, self.counts['favorites']),
+            (ShoppingCart, self.counts['carts']),
+        ):
+            self.insert(model, (
+                model(user_id=user_id, recipe_id=recipe_id)
+                for user_id, recipe_id in self.choose_pairs(
+                    user_ids,
+                    activity,
+                    recipe_ids,
+                    popularity,
+                    count,
+                )
+            ))
+        self.insert(Subscribe, (
+            Subscribe(user_id=user_id, subscriber_id=author_id)
+            for user_id, author_id in self.choose_pairs(
+                user_ids,
+                activity,
+                user_ids,
+                author_weights,
+                self.counts['subscriptions'],
+                exclude_same=True,
+            )
+        ))
+
+    def rebuild_aggregates(self):
+        for command in ('reconcile_counters', 'rebuild_shopping_lists'):
+            call_command(command, stdout=io.StringIO())
+        # Рецепты и подписки записаны в обход сигналов.
+        FeedEntry.fan_out_pending()
+        DataVersion.bump(
+            'recipes',
+            'tags',
+            'ingredients',
+            'users',
+        )
+
+    def generate(self):
+        """Создаёт данные и возвращает id пользователей."""
+        with transaction.atomic():
+            field = Recipe._meta.get_field('image')
+            image = field.storage.save(
+                os.path.join(field.upload_to, 'fake.png'),
+                make_image(self.seed),
+            )
+            tag_ids = self.create_tags()
+            ingredient_ids = self.create_ingredients()
+            user_ids = self.create_users()
+            # Одни и те же веса: плодовитые авторы
+            # собирают и больше подписчиков.
+            author_weights = self.get_weights(len(user_ids))
+            recipe_ids = self.create_recipes(
+                user_ids,
+                author_weights,
+                image,
+            )
+            self.create_recipe_relations(recipe_ids, ingredient_ids, tag_ids)
+            self.create_user_relations(user_ids, author_weights, recipe_ids)
+            self.rebuild_aggregates()
+        return user_ids
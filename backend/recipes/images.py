@@ -0,0 +1,208 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+from recipes.models import DataVersion, Recipe
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VARIANTS = {
+    'list': (320, 320, True),
+    'card': (640, 640, True),
+    'detail': (1280, 1280, False),
+}
+
+FORMATS = (
+    ('JPEG', 'jpg', {'quality': 85, 'optimize': True, 'progressive': True}),
+    ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    ('AVIF', 'avif', {'quality': 60}),
+)
+
+IMAGE_LOCK_KEY = 'recipe-images'
+
+_executors = {}
+_executor_lock = threading.Lock()
+
+
+def get_options():
+    return getattr(settings, 'RECIPE_IMAGE_VARIANTS', {})
+
+
+def get_formats():
+    Image.init()
+    return [
+        (image_format, extension, params)
+        for image_format, extension, params in FORMATS
+        if image_format in Image.SAVE
+    ]
+
+
+def get_executor():
+    workers = get_options().get('WORKERS', 2)
+    with _executor_lock:
+        if workers not in _executors:
+            _executors[workers] = ThreadPoolExecutor(
+                max_workers=workers,
+                thread_name_prefix='recipe-images',
+            )
+        return _executors[workers]
+
+
+def get_variant_name(source, size_name, extension):
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(
+        Recipe._meta.get_field('image').upload_to,
+        'variants',
+        f'{stem}_{size_name}.{extension}',
+    )
+
+
+def render_variant(image, width, height, crop, image_format, params):
+    if crop:
+        variant = ImageOps.fit(image, (width, height), Image.LANCZOS)
+    else:
+        variant = image.copy()
+        variant.thumbnail((width, height), Image.LANCZOS)
+    if image_format == 'JPEG' and variant.mode != 'RGB':
+        variant = variant.convert('RGB')
+    buffer = io.BytesIO()
+    variant.save(buffer, image_format, **params)
+    return buffer.getvalue()
+
+
+def build_variants(storage, source):
+    """Создаёт уменьшенные копии и возвращает словарь путей."""
+    with storage.open(source, 'rb') as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    variants = {'source': source}
+    sizes = get_options().get('SIZES', DEFAULT_VARIANTS)
+    for size_name, (width, height, crop) in sizes.items():
+        variants[size_name] = {}
+        for image_format, extension, params in get_formats():
+            variants[size_name][extension] = storage.save(
+                get_variant_name(source, size_name, extension),
+                ContentFile(render_variant(
+                    image,
+                    width,
+                    height,
+                    crop,
+                    image_format,
+                    params,
+                )),
+            )
+    return variants
+
+
+def lock_image_files():
+    """Блокирует файлы фото до конца текущей транзакции.
+
+    Одинаковые фото хранятся одним файлом, и загрузка может
+    получить имя файла, который сборщик как раз удаляет.
+    Загрузка и сборщик по очереди берут одну строку
+    DataVersion FOR UPDATE: сборщик видит ссылку из уже
+    закоммиченного рецепта, а загрузка - что файла больше
+    нет, и пишет его заново.
+    """
+    DataVersion.objects.select_for_update().get_or_create(
+        key=IMAGE_LOCK_KEY,
+    )
+
+
+def find_variants(source):
+    """Готовые копии того же файла фото у другого рецепта.
+
+    Имя оригинала - хэш содержимого, поэтому копии рецепта
+    с тем же image подходят, если в них есть все нужные
+    размеры и форматы.
+    """
+    variants = Recipe.objects.filter(
+        image=source,
+        image_variants__source=source,
+    ).values_list('image_variants', flat=True).first()
+    if variants is None:
+        return None
+    extensions = {extension for _, extension, _ in get_formats()}
+    sizes = get_options().get('SIZES', DEFAULT_VARIANTS)
+    if all(
+        set(variants.get(size_name, ())) == extensions
+        for size_name in sizes
+    ):
+        return variants
+    return None
+
+
+def get_image_files(source, variants):
+    """Имена оригинала фото и всех его копий."""
+    names = {source} if source else set()
+    for size_name, files in variants.items():
+        if size_name != 'source':
+            names.update(files.values())
+    return names
+
+
+def delete_orphaned_images(storage, source, variants):
+    """Удаляет фото и копии, на которые не ссылается ни один рецепт.
+
+    Одинаковые фото хранятся одним файлом, поэтому файл
+    удаляется, только если его больше нет ни у одного рецепта.
+    Копии удаляются вместе с оригиналом, из которого получены.
+    Ссылки проверяются под lock_image_files.
+    """
+    variants_source = variants.get('source')
+    with transaction.atomic():
+        lock_image_files()
+        referenced = set(
+            Recipe.objects.filter(
+                image__in=[
+                    name for name in (source, variants_source) if name
+                ],
+            ).values_list('image', flat=True),
+        )
+        names = set()
+        if source and source not in referenced:
+            names.add(source)
+        if variants_source not in referenced:
+            names.update(get_image_files(None, variants))
+        for name in names:
+            if storage.exists(name):
+                storage.delete(name)
+
+
+def generate_variants(recipe_id, source):
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None or recipe.image.name != source:
+        return
+    recipe.image_variants = find_variants(source) or build_variants(
+        recipe.image.storage,
+        source,
+    )
+    recipe.save(update_fields=['image_variants', 'updated_at'])
+
+
+def run_in_pool(recipe_id, source):
+    try:
+        generate_variants(recipe_id, source)
+    except Exception:
+        logger.exception('Не удалось обработать фото рецепта %s', recipe_id)
+    finally:
+        connections.close_all()
+
+
+def schedule_variants(recipe):
+    """Ставит генерацию копий фото в пул после коммита транзакции."""
+    if not recipe.image:
+        return
+    if get_options().get('ASYNC', True):
+        get_executor().submit(run_in_pool, recipe.pk, recipe.image.name)
+    else:
+        generate_variants(recipe.pk, recipe.image.name)
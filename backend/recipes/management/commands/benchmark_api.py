@@ -0,0 +1,233 @@
+import json
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from recipes.fake_data import (FakeDataGenerator, database_available,
+                               test_environment)
+from recipes.models import Ingredient
+
+TRACED_REQUESTS = 3
+
+ENDPOINTS = (
+    ('recipes', '/api/recipes/?limit=6'),
+    ('subscriptions', '/api/users/subscriptions/?recipes_limit=3'),
+    ('ingredients', '/api/ingredients/?name={prefix}'),
+    ('download_shopping_cart', '/api/recipes/download_shopping_cart/'),
+)
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = (len(values) - 1) * percent / 100
+    lower = int(index)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (index - lower)
+
+
+class Command(BaseCommand):
+    """Воспроизводимый бенчмарк основных эндпоинтов API.
+
+    Создаёт тестовую базу (как manage.py test: SQLite в
+    памяти или test_<имя> на PostgreSQL из настроек; с
+    --sqlite или при недоступной базе - SQLite в памяти),
+    заполняет её FakeDataGenerator с заданным seed и
+    прогоняет запросы через тестовый клиент в процессе.
+    Для каждого эндпоинта считаются p50/p95/p99 задержки,
+    число SQL-запросов и пик выделенной памяти (отдельным
+    проходом под tracemalloc, чтобы он не искажал время).
+
+    С --save-baseline результат пишется в JSON, с
+    --baseline сравнивается с сохранённым: больше
+    запросов, p50 хуже на --tolerance (и не меньше чем на
+    --min-delta-ms) или память хуже на --tolerance -
+    команда завершается с ошибкой.
+    """
+
+    help = 'Бенчмарк эндпоинтов API на детерминированных данных.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=100,
+            help='Замеряемых запросов на эндпоинт.',
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=10,
+            help='Запросов на прогрев перед замером.',
+        )
+        parser.add_argument(
+            '--baseline',
+            help='JSON с прошлым результатом для сравнения.',
+        )
+        parser.add_argument(
+            '--save-baseline',
+            help='Куда сохранить результат в JSON.',
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.25,
+            help='Допустимое ухудшение p50 и памяти, доля.',
+        )
+        parser.add_argument(
+            '--min-delta-ms',
+            type=float,
+            default=1.0,
+            help='Ухудшение p50 меньше этого не считается регрессией.',
+        )
+        parser.add_argument(
+            '--sqlite',
+            action='store_true',
+            help='Гонять на SQLite в памяти вместо базы из настроек.',
+        )
+        parser.add_argument(
+            '--keepdb',
+            action='store_true',
+            help='Не удалять тестовую базу после прогона.',
+        )
+
+    def get_client(self, user_ids):
+        token, _ = Token.objects.get_or_create(user_id=user_ids[0])
+        return Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def request(self, client, url):
+        response = client.get(url)
+        if response.status_code != 200:
+            raise CommandError(f'{url}: статус {response.status_code}')
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def count_queries(self, client, url):
+        queries = []
+
+        def count(execute, sql, *args):
+            queries.append(sql)
+            return execute(sql, *args)
+
+        with connection.execute_wrapper(count):
+            self.request(client, url)
+        return len(queries)
+
+    def measure(self, client, url, options):
+        for _ in range(options['warmup']):
+            self.request(client, url)
+        timings = []
+        for _ in range(options['iterations']):
+            started = time.perf_counter()
+            self.request(client, url)
+            timings.append((time.perf_counter() - started) * 1000)
+        peaks = []
+        for _ in range(TRACED_REQUESTS):
+            tracemalloc.start()
+            self.request(client, url)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        # Минимум по нескольким запросам отсекает разовые
+        # выделения вроде сборки кэшей.
+        peak = min(peaks)
+        return {
+            'p50_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'queries': self.count_queries(client, url),
+            'peak_kb': round(peak / 1024, 1),
+        }
+
+    def run(self, options):
+        user_ids = FakeDataGenerator(
+            seed=options['seed'],
+            users=options['users'],
+            recipes=options['recipes'],
+            ingredients=options['ingredients'],
+        ).generate()
+        client = self.get_client(user_ids)
+        prefix = Ingredient.objects.order_by('id').first().name[:2]
+        results = {}
+        for name, url in ENDPOINTS:
+            results[name] = self.measure(
+                client,
+                url.format(prefix=prefix),
+                options,
+            )
+            self.stdout.write(
+                f'{name}: '
+                + ', '.join(
+                    f'{key}={value}'
+                    for key, value in results[name].items()
+                ),
+            )
+        return results
+
+    def compare(self, results, baseline, options):
+        tolerance = options['tolerance']
+        regressions = []
+        for name, result in results.items():
+            expected = baseline.get('endpoints', {}).get(name)
+            if expected is None:
+                continue
+            if result['queries'] > expected['queries']:
+                regressions.append(
+                    f'{name}: запросов {result["queries"]} '
+                    f'вместо {expected["queries"]}',
+                )
+            if result['p50_ms'] > max(
+                expected['p50_ms'] * (1 + tolerance),
+                expected['p50_ms'] + options['min_delta_ms'],
+            ):
+                regressions.append(
+                    f'{name}: p50_ms {result["p50_ms"]} '
+                    f'вместо {expected["p50_ms"]}',
+                )
+            if result['peak_kb'] > expected['peak_kb'] * (1 + tolerance):
+                regressions.append(
+                    f'{name}: peak_kb {result["peak_kb"]} '
+                    f'вместо {expected["peak_kb"]}',
+                )
+        return regressions
+
+    def handle(self, *args, **options):
+        sqlite = options['sqlite']
+        if not sqlite and not database_available():
+            self.stderr.write(
+                'База из настроек недоступна, бенчмарк идёт на SQLite.',
+            )
+            sqlite = True
+        with test_environment(options['keepdb'], sqlite=sqlite):
+            results = self.run(options)
+            vendor = connection.vendor
+        report = {
+            'vendor': vendor,
+            'seed': options['seed'],
+            'users': options['users'],
+            'recipes': options['recipes'],
+            'ingredients': options['ingredients'],
+            'endpoints': results,
+        }
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as file:
+                json.dump(report, file, indent=2, sort_keys=True)
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                baseline = json.load(file)
+            if baseline.get('vendor') != report['vendor']:
+                self.stderr.write('База в эталоне другая, сравнение условно.')
+            regressions = self.compare(results, baseline, options)
+            if regressions:
+                raise CommandError(
+                    'Регрессии:\n' + '\n'.join(regressions),
+                )
+        self.stdout.write(self.style.SUCCESS('Бенчмарк завершён.'))
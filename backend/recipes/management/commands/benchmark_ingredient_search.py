@@ -0,0 +1,72 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.filters import IngredientsFilter
+from api.ingredient_index import ingredient_index
+from api.serializers import IngredientSerializer
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    """Сравнение поиска ингредиентов: ORM и индекс в памяти."""
+
+    help = 'Микробенчмарк автодополнения ингредиентов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Сколько раз прогнать набор префиксов.',
+        )
+        parser.add_argument(
+            '--prefix-length',
+            type=int,
+            default=2,
+            help='Длина префиксов, взятых из названий ингредиентов.',
+        )
+
+    def get_prefixes(self, length):
+        names = Ingredient.objects.values_list('name', flat=True)
+        return sorted({name[:length] for name in names if name})
+
+    def run_orm(self, prefix):
+        queryset = IngredientsFilter(
+            {'name': prefix},
+            queryset=Ingredient.objects.all(),
+        ).qs
+        return IngredientSerializer(queryset, many=True).data
+
+    def run_index(self, prefix):
+        return ingredient_index.search(prefix, limit=None)
+
+    def measure(self, func, prefixes, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for prefix in prefixes:
+                func(prefix)
+        return (time.perf_counter() - started) / (repeat * len(prefixes))
+
+    def handle(self, *args, **options):
+        prefixes = self.get_prefixes(options['prefix_length'])
+        if not prefixes:
+            self.stdout.write(self.style.WARNING('Нет ингредиентов.'))
+            return
+        started = time.perf_counter()
+        ingredient_index.invalidate()
+        ingredient_index.get_data()
+        build_time = time.perf_counter() - started
+        orm_time = self.measure(self.run_orm, prefixes, options['repeat'])
+        index_time = self.measure(
+            self.run_index,
+            prefixes,
+            options['repeat'],
+        )
+        self.stdout.write(f'Префиксов: {len(prefixes)}')
+        self.stdout.write(f'Построение индекса: {build_time * 1000:.2f} мс')
+        self.stdout.write(f'ORM: {orm_time * 1e6:.1f} мкс/запрос')
+        self.stdout.write(f'Индекс: {index_time * 1e6:.1f} мкс/запрос')
+        self.stdout.write(self.style.SUCCESS(
+            f'Ускорение: x{orm_time / index_time:.1f}',
+        ))
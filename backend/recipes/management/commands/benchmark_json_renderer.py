@@ -0,0 +1,121 @@
+import io
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.parsers import ORJSONParser
+from api.renderers import ORJSONRenderer, orjson
+from api.serializers import IngredientSerializer
+from api.views import RecipeViewSet, UsersViewSet
+from recipes.models import Ingredient, Subscribe
+
+
+class Command(BaseCommand):
+    """Сравнение JSONRenderer/JSONParser и вариантов на orjson.
+
+    Данные берутся из тех же ответов, что отдаёт API:
+    полный каталог ингредиентов, страница рецептов с ?limit=
+    и страница подписок. Для каждого ответа проверяется,
+    что байты совпадают.
+    """
+
+    help = 'Микробенчмарк рендеринга и разбора JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=50,
+            help='Сколько раз отрендерить каждый ответ.',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=100,
+            help='Размер страниц рецептов и подписок.',
+        )
+
+    def get_view_data(self, view, path, user):
+        request = APIRequestFactory().get(path)
+        force_authenticate(request, user=user)
+        # Поля фото строят абсолютные ссылки, а хоста
+        # фабрики запросов нет в ALLOWED_HOSTS.
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+        ):
+            return view(request).data
+
+    def get_payloads(self, limit):
+        payloads = {
+            'ingredients': IngredientSerializer(
+                Ingredient.objects.all(),
+                many=True,
+            ).data,
+        }
+        subscription = Subscribe.objects.select_related('user').first()
+        if subscription is None:
+            return payloads
+        user = subscription.user
+        payloads['recipes'] = self.get_view_data(
+            RecipeViewSet.as_view({'get': 'list'}),
+            f'/api/recipes/?limit={limit}',
+            user,
+        )
+        payloads['subscriptions'] = self.get_view_data(
+            UsersViewSet.as_view({'get': 'subscriptions'}),
+            f'/api/users/subscriptions/?limit={limit}',
+            user,
+        )
+        return payloads
+
+    def measure(self, func, argument, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            func(argument)
+        return (time.perf_counter() - started) / repeat
+
+    def report(self, name, size, json_time, orjson_time):
+        self.stdout.write(
+            f'{name}: {size / 1024:.1f} КБ, '
+            f'json {size / json_time / 2 ** 20:.1f} МБ/с, '
+            f'orjson {size / orjson_time / 2 ** 20:.1f} МБ/с, '
+            f'x{json_time / orjson_time:.1f}',
+        )
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write(self.style.WARNING(
+                'orjson не установлен, сравнивать не с чем.',
+            ))
+            return
+        repeat = options['repeat']
+        for name, data in self.get_payloads(options['limit']).items():
+            expected = JSONRenderer().render(data)
+            if ORJSONRenderer().render(data) != expected:
+                self.stderr.write(f'{name}: ответы ORJSONRenderer отличаются!')
+            self.report(
+                f'{name}, рендеринг',
+                len(expected),
+                self.measure(JSONRenderer().render, data, repeat),
+                self.measure(ORJSONRenderer().render, data, repeat),
+            )
+            self.report(
+                f'{name}, разбор',
+                len(expected),
+                self.measure(
+                    lambda body: JSONParser().parse(io.BytesIO(body)),
+                    expected,
+                    repeat,
+                ),
+                self.measure(
+                    lambda body: ORJSONParser().parse(io.BytesIO(body)),
+                    expected,
+                    repeat,
+                ),
+            )
+        self.stdout.write(self.style.SUCCESS('Готово.'))
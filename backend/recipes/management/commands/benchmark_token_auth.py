@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from api.authentication import CachedTokenAuthentication, token_user_cache
+
+
+class Command(BaseCommand):
+    """Сравнение аутентификации по токену: с кэшем и без."""
+
+    help = 'Микробенчмарк аутентификации по токену.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=1000,
+            help='Сколько раз аутентифицировать запрос.',
+        )
+
+    def measure(self, authentication, request, repeat):
+        queries = 0
+
+        def count_queries(execute, *args):
+            nonlocal queries
+            queries += 1
+            return execute(*args)
+
+        with connection.execute_wrapper(count_queries):
+            started = time.perf_counter()
+            for _ in range(repeat):
+                authentication.authenticate(request)
+            elapsed = time.perf_counter() - started
+        return elapsed / repeat, queries / repeat
+
+    def handle(self, *args, **options):
+        token = Token.objects.filter(user__is_active=True).first()
+        if token is None:
+            self.stdout.write(self.style.WARNING('Нет токенов.'))
+            return
+        request = RequestFactory().get(
+            '/api/recipes/',
+            HTTP_AUTHORIZATION=f'Token {token.key}',
+        )
+        repeat = options['repeat']
+        plain_time, plain_queries = self.measure(
+            TokenAuthentication(),
+            request,
+            repeat,
+        )
+        token_user_cache.invalidate(token.key)
+        cached_time, cached_queries = self.measure(
+            CachedTokenAuthentication(),
+            request,
+            repeat,
+        )
+        self.stdout.write(
+            f'TokenAuthentication: {plain_time * 1e6:.1f} мкс, '
+            f'{plain_queries:.2f} запроса/запрос',
+        )
+        self.stdout.write(
+            f'CachedTokenAuthentication: {cached_time * 1e6:.1f} мкс, '
+            f'{cached_queries:.3f} запроса/запрос',
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Ускорение: x{plain_time / cached_time:.1f}, '
+            f'сэкономлено запросов: {plain_queries - cached_queries:.3f} '
+            'на запрос',
+        ))
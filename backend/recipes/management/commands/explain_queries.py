@@ -0,0 +1,171 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Exists, OuterRef
+
+from recipes.models import (FavoriteRecipes, Ingredient, IngredientsInRecipe,
+                            Recipe, ShoppingCart, ShoppingListItem, Subscribe)
+from users.models import User
+
+
+def recipe_page(params):
+    return Recipe.objects.order_by('-pub_date', '-id')[:6]
+
+
+def favorited_recipes(params):
+    return Recipe.objects.annotate(
+        favorited=Exists(
+            FavoriteRecipes.objects.filter(
+                user_id=params['user_id'],
+                recipe=OuterRef('pk'),
+            ),
+        ),
+    ).filter(favorited=True).order_by('-pub_date', '-id')[:6]
+
+
+def shopping_cart_recipes(params):
+    return Recipe.objects.annotate(
+        in_shopping_cart=Exists(
+            ShoppingCart.objects.filter(
+                user_id=params['user_id'],
+                recipe=OuterRef('pk'),
+            ),
+        ),
+    ).filter(in_shopping_cart=True).order_by('-pub_date', '-id')[:6]
+
+
+def author_recipes(params):
+    return Recipe.objects.filter(
+        author_id=params['author_id'],
+    ).order_by('-pub_date', '-id')[:3]
+
+
+def subscription(params):
+    return Subscribe.objects.filter(
+        user_id=params['user_id'],
+        subscriber_id=params['author_id'],
+    ).values('id')[:1]
+
+
+def followers(params):
+    return Subscribe.objects.filter(
+        subscriber_id=params['author_id'],
+    ).values_list('user_id', flat=True)
+
+
+def subscriptions_page(params):
+    return User.objects.filter(
+        id__in=Subscribe.objects.filter(
+            user_id=params['user_id'],
+        ).values('subscriber_id'),
+    ).order_by('id')[:6]
+
+
+def recipe_ingredients(params):
+    return IngredientsInRecipe.objects.filter(
+        recipe_id__in=params['recipe_ids'],
+    ).select_related('ingredient')
+
+
+def ingredient_search(params):
+    return Ingredient.objects.filter(name__istartswith=params['prefix'])
+
+
+def shopping_list(params):
+    return ShoppingListItem.get_totals([params['user_id']])
+
+
+QUERIES = (
+    ('recipe_page', recipe_page),
+    ('favorited_recipes', favorited_recipes),
+    ('shopping_cart_recipes', shopping_cart_recipes),
+    ('author_recipes', author_recipes),
+    ('subscription', subscription),
+    ('followers', followers),
+    ('subscriptions_page', subscriptions_page),
+    ('recipe_ingredients', recipe_ingredients),
+    ('ingredient_search', ingredient_search),
+    ('shopping_list', shopping_list),
+)
+
+
+class Command(BaseCommand):
+    """Планы выполнения самых частых запросов API.
+
+    Запросы повторяют фильтры и сортировки вьюх: страницы
+    рецептов, фильтры избранного и списка покупок,
+    подписки, поиск ингредиентов. Параметры берутся из
+    текущей базы: самый активный подписчик, самый
+    популярный автор, начало названия первого ингредиента.
+    По планам видно, какие индексы используются; с
+    --analyze на PostgreSQL запросы выполняются
+    (EXPLAIN ANALYZE, BUFFERS).
+    """
+
+    help = 'EXPLAIN для основных запросов API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'names',
+            nargs='*',
+            help='Какие запросы показать, по умолчанию все: '
+                 + ', '.join(name for name, _ in QUERIES),
+        )
+        parser.add_argument(
+            '--analyze',
+            action='store_true',
+            help='EXPLAIN ANALYZE, только PostgreSQL.',
+        )
+        parser.add_argument(
+            '--sql',
+            action='store_true',
+            help='Печатать и сам запрос.',
+        )
+
+    def get_params(self):
+        follower = Subscribe.objects.values('user_id').annotate(
+            count=Count('id'),
+        ).order_by('-count').first()
+        author = Subscribe.objects.values('subscriber_id').annotate(
+            count=Count('id'),
+        ).order_by('-count').first()
+        ingredient = Ingredient.objects.order_by('id').first()
+        if follower is None or ingredient is None:
+            raise CommandError(
+                'В базе нет подписок или ингредиентов, '
+                'заполните её командой generate_fake_data.',
+            )
+        return {
+            'user_id': follower['user_id'],
+            'author_id': author['subscriber_id'],
+            'prefix': ingredient.name[:2],
+            'recipe_ids': list(
+                Recipe.objects.order_by('-pub_date', '-id').values_list(
+                    'id',
+                    flat=True,
+                )[:6],
+            ),
+        }
+
+    def get_explain_options(self, analyze):
+        if not analyze:
+            return {}
+        if connection.vendor != 'postgresql':
+            raise CommandError('--analyze поддерживается только PostgreSQL.')
+        return {'analyze': True, 'buffers': True}
+
+    def handle(self, *args, **options):
+        queries = dict(QUERIES)
+        unknown = set(options['names']) - queries.keys()
+        if unknown:
+            raise CommandError(
+                'Неизвестные запросы: ' + ', '.join(sorted(unknown)),
+            )
+        explain_options = self.get_explain_options(options['analyze'])
+        params = self.get_params()
+        for name in options['names'] or queries:
+            queryset = queries[name](params)
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            if options['sql']:
+                self.stdout.write(str(queryset.query))
+            self.stdout.write(queryset.explain(**explain_options))
+            self.stdout.write('')
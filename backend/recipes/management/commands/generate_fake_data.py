@@ -0,0 +1,96 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.fake_data import FakeDataGenerator
+from users.models import User
+
+
+class Command(BaseCommand):
+    """Наполнение базы тестовыми данными.
+
+    Пишет пользователей, теги, ингредиенты, рецепты,
+    ингредиенты рецептов, избранное, списки покупок и
+    подписки через FakeDataGenerator. Данные зависят
+    только от --seed и размеров, так что прогон можно
+    повторить на другой базе. Повторный запуск с тем же
+    --seed на той же базе запрещён: имена совпадут.
+
+    Порядок размеров для миллиона строк:
+    --users 20000 --recipes 100000 даёт около 800 тысяч
+    ингредиентов рецептов и 350 тысяч остальных связей.
+    """
+
+    help = 'Генерация тестовых данных со скошенными распределениями.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument(
+            '--ingredients-per-recipe',
+            type=int,
+            default=8,
+            help='Среднее число ингредиентов в рецепте.',
+        )
+        parser.add_argument(
+            '--favorites',
+            type=int,
+            help='Всего записей избранного, по умолчанию 10 на пользователя.',
+        )
+        parser.add_argument(
+            '--carts',
+            type=int,
+            help='Всего записей в списках покупок, по умолчанию 5 на '
+                 'пользователя.',
+        )
+        parser.add_argument(
+            '--subscriptions',
+            type=int,
+            help='Всего подписок, по умолчанию 5 на пользователя.',
+        )
+        parser.add_argument(
+            '--skew',
+            type=float,
+            default=1.0,
+            help='Показатель распределения Ципфа, 0 - равномерное.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Строк в одном INSERT.',
+        )
+
+    def handle(self, *args, **options):
+        seed = options['seed']
+        if User.objects.filter(username__startswith=f'fake{seed}_').exists():
+            raise CommandError(
+                f'Данные с --seed {seed} уже есть в базе, укажите другой.',
+            )
+        started = time.perf_counter()
+
+        def log(message):
+            self.stdout.write(
+                f'[{time.perf_counter() - started:.1f} с] {message}',
+            )
+
+        FakeDataGenerator(
+            seed=seed,
+            users=options['users'],
+            recipes=options['recipes'],
+            ingredients=options['ingredients'],
+            tags=options['tags'],
+            ingredients_per_recipe=options['ingredients_per_recipe'],
+            favorites=options['favorites'],
+            carts=options['carts'],
+            subscriptions=options['subscriptions'],
+            skew=options['skew'],
+            batch_size=options['batch_size'],
+            log=log,
+        ).generate()
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные созданы за {time.perf_counter() - started:.1f} с.',
+        ))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import generate_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """Создание уменьшенных копий фото для уже загруженных рецептов."""
+
+    help = 'Создание уменьшенных копий фото рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересоздать копии и для рецептов, где они уже есть.',
+        )
+
+    def handle(self, *args, **options):
+        processed = 0
+        recipes = Recipe.objects.exclude(image='').only(
+            'id',
+            'image',
+            'image_variants',
+        )
+        for recipe in recipes.iterator():
+            if (
+                not options['force']
+                and recipe.image_variants.get('source') == recipe.image.name
+            ):
+                continue
+            generate_variants(recipe.id, recipe.image.name)
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано рецептов: {processed}',
+        ))
@@ -1,27 +1,184 @@
 import csv
+import io
+import json
+import os
+import time
+from itertools import islice
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 
-from recipes.models import Ingredient
+from recipes.models import DataVersion, Ingredient
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) != 2:
+            yield None
+            continue
+        yield row
+
+
+def read_json(file):
+    """Потоковое чтение JSON-массива объектов без загрузки файла целиком."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(READ_CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидался JSON-массив ингредиентов.')
+    buffer = buffer[1:]
+    eof = False
+    while True:
+        buffer = buffer.lstrip(', \t\r\n')
+        if buffer.startswith(']') or eof and not buffer:
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise CommandError('Некорректный JSON в файле.')
+            chunk = file.read(READ_CHUNK_SIZE)
+            eof = not chunk
+            buffer += chunk
+            continue
+        buffer = buffer[end:]
+        if isinstance(item, dict):
+            yield [item.get('name'), item.get('measurement_unit')]
+        else:
+            yield None
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
 
 
 class Command(BaseCommand):
-    """Загрузка базы ингредиентов."""
+    """Загрузка базы ингредиентов.
+
+    Файл читается потоково пачками по --batch-size строк,
+    пачки вставляются через bulk_create(ignore_conflicts=True)
+    в одной транзакции, поэтому повторный запуск ничего
+    не дублирует. На PostgreSQL пачка идёт через COPY во
+    временную таблицу и INSERT ... ON CONFLICT DO NOTHING.
+    """
 
     help = 'Загрузка базы ингредиентов.'
 
-    def handle(self, *args, **options):
-        with open(
-            f'{settings.BASE_DIR}/data/ingredients.csv',
-            'r',
-            encoding='utf-8',
-        ) as file:
-            file_reader = csv.reader(file)
-            for row in file_reader:
-                name, measurement_unit = row
-                Ingredient.objects.get_or_create(
-                    name=name,
-                    measurement_unit=measurement_unit)
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            default=os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv'),
+            help='Путь к файлу с ингредиентами.',
+        )
+        parser.add_argument(
+            '--format',
+            choices=sorted(READERS),
+            help='Формат файла, по умолчанию - по расширению.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Размер пачки для вставки.',
+        )
+
+    def get_format(self, options):
+        file_format = options['format']
+        if file_format is None:
+            file_format = os.path.splitext(options['file'])[1][1:].lower()
+        if file_format not in READERS:
+            raise CommandError(
+                f'Неизвестный формат файла: {file_format or "?"}.',
+            )
+        return file_format
+
+    def clean_rows(self, rows):
+        for row in rows:
+            if row is None:
+                self.invalid += 1
+                continue
+            name, measurement_unit = (
+                str(value or '').strip() for value in row
+            )
+            if not name or not measurement_unit:
+                self.invalid += 1
+                continue
+            yield name, measurement_unit
+
+    def get_batches(self, rows, batch_size):
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return
+            yield batch
 
+    def insert_batch(self, batch):
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in batch
+            ],
+            ignore_conflicts=True,
+        )
+
+    def copy_batch(self, cursor, batch):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(batch)
+        buffer.seek(0)
+        cursor.execute('TRUNCATE ingredients_import')
+        cursor.copy_expert(
+            'COPY ingredients_import (name, measurement_unit) '
+            'FROM STDIN WITH (FORMAT csv)',
+            buffer,
+        )
+        cursor.execute(
+            f'INSERT INTO {Ingredient._meta.db_table} '
+            '(name, measurement_unit) '
+            'SELECT DISTINCT name, measurement_unit FROM ingredients_import '
+            'ON CONFLICT DO NOTHING',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+        reader = READERS[self.get_format(options)]
+        use_copy = connection.vendor == 'postgresql'
+        self.invalid = 0
+        total = 0
+        started = time.perf_counter()
+        with open(options['file'], 'r', encoding='utf-8') as file:
+            with transaction.atomic(), connection.cursor() as cursor:
+                count_before = Ingredient.objects.count()
+                if use_copy:
+                    cursor.execute(
+                        'CREATE TEMPORARY TABLE ingredients_import '
+                        '(name varchar(250), measurement_unit varchar(250)) '
+                        'ON COMMIT DROP',
+                    )
+                for batch in self.get_batches(
+                    self.clean_rows(reader(file)),
+                    options['batch_size'],
+                ):
+                    total += len(batch)
+                    if use_copy:
+                        self.copy_batch(cursor, batch)
+                    else:
+                        self.insert_batch(batch)
+                inserted = Ingredient.objects.count() - count_before
+                if inserted:
+                    DataVersion.bump('ingredients')
+        elapsed = time.perf_counter() - started
+        rate = (total + self.invalid) / elapsed if elapsed else 0
+        self.stdout.write(
+            f'Прочитано строк: {total + self.invalid}, '
+            f'добавлено: {inserted}, '
+            f'пропущено: {total - inserted + self.invalid} '
+            f'(некорректных: {self.invalid}), '
+            f'{rate:.0f} строк/с.',
+        )
         self.stdout.write(self.style.SUCCESS('Ингридиенты загружены!'))
@@ -0,0 +1,130 @@
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.images import get_image_files, get_variant_name
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """Перенос фото рецептов в хранилище по хэшу содержимого.
+
+    Фото и его копии пересохраняются через recipe_image_storage,
+    старые файлы удаляет сигнал delete_replaced_image, если
+    на них больше никто не ссылается. Рецепты, где фото
+    уже лежит по адресу хэша, пропускаются, поэтому команду
+    можно запускать повторно.
+    С --collect-orphans после переноса удаляются все файлы
+    каталога фото, на которые не ссылается ни один рецепт.
+    Запускать её лучше без параллельных загрузок: файл
+    загрузки, чья транзакция ещё не завершилась, тоже
+    считается ничьим.
+    """
+
+    help = 'Перенос фото рецептов в хранилище по хэшу содержимого.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать файлы, ничего не менять.',
+        )
+        parser.add_argument(
+            '--collect-orphans',
+            action='store_true',
+            help='Удалить файлы, на которые не ссылается ни один рецепт.',
+        )
+
+    def move(self, storage, name, target):
+        with storage.open(name, 'rb') as file:
+            return storage.save(target, file)
+
+    def move_variants(self, storage, variants, source):
+        moved = {'source': source}
+        for size_name, files in variants.items():
+            if size_name == 'source':
+                continue
+            moved[size_name] = {}
+            for extension, name in files.items():
+                if not storage.exists(name):
+                    # Без копий сигнал build_image_variants
+                    # пересоздаст их из нового оригинала.
+                    return {}
+                moved[size_name][extension] = self.move(
+                    storage,
+                    name,
+                    get_variant_name(source, size_name, extension),
+                )
+        return moved
+
+    def migrate(self, storage, dry_run):
+        moved = missing = 0
+        recipes = Recipe.objects.exclude(image='').only(
+            'id',
+            'image',
+            'image_variants',
+        )
+        for recipe in recipes.iterator():
+            if storage.is_hashed(recipe.image.name):
+                continue
+            if not storage.exists(recipe.image.name):
+                missing += 1
+                self.stderr.write(
+                    f'Рецепт {recipe.id}: нет файла {recipe.image.name}',
+                )
+                continue
+            moved += 1
+            if dry_run:
+                continue
+            with transaction.atomic():
+                source = self.move(
+                    storage,
+                    recipe.image.name,
+                    recipe.image.name,
+                )
+                recipe.image_variants = self.move_variants(
+                    storage,
+                    recipe.image_variants,
+                    source,
+                )
+                recipe.image.name = source
+                recipe.save(
+                    update_fields=['image', 'image_variants', 'updated_at'],
+                )
+        return moved, missing
+
+    def walk(self, storage, directory):
+        directories, files = storage.listdir(directory)
+        for name in files:
+            yield os.path.join(directory, name)
+        for name in directories:
+            yield from self.walk(storage, os.path.join(directory, name))
+
+    def collect_orphans(self, storage, dry_run):
+        referenced = set()
+        recipes = Recipe.objects.values_list('image', 'image_variants')
+        for image, variants in recipes.iterator():
+            referenced.update(get_image_files(image, variants))
+        directory = Recipe._meta.get_field('image').upload_to
+        if not storage.exists(directory):
+            return 0
+        orphans = [
+            name for name in self.walk(storage, directory)
+            if name not in referenced
+        ]
+        if not dry_run:
+            for name in orphans:
+                storage.delete(name)
+        return len(orphans)
+
+    def handle(self, *args, **options):
+        storage = Recipe._meta.get_field('image').storage
+        moved, missing = self.migrate(storage, options['dry_run'])
+        self.stdout.write(
+            f'Перенесено фото: {moved}, без файла: {missing}.',
+        )
+        if options['collect_orphans']:
+            orphans = self.collect_orphans(storage, options['dry_run'])
+            self.stdout.write(f'Ничьих файлов: {orphans}.')
+        self.stdout.write(self.style.SUCCESS('Фото рецептов перенесены!'))
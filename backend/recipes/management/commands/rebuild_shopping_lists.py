@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    """Пересборка и проверка сводных списков покупок."""
+
+    help = 'Пересборка и проверка сводных списков покупок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сравнить с исходными данными, ничего не менять.',
+        )
+
+    def get_differences(self):
+        expected = {
+            (row['recipe__shopping_cart__user_id'], row['ingredient_id']):
+                row['total']
+            for row in ShoppingListItem.get_totals().iterator()
+        }
+        stored = {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total in
+            ShoppingListItem.objects.values_list(
+                'user_id',
+                'ingredient_id',
+                'total',
+            ).iterator()
+        }
+        return {
+            key for key in expected.keys() | stored.keys()
+            if expected.get(key) != stored.get(key)
+        }
+
+    def handle(self, *args, **options):
+        differences = self.get_differences()
+        self.stdout.write(f'Расхождений: {len(differences)}')
+        if options['verify']:
+            if differences:
+                raise CommandError('Сводные списки покупок расходятся.')
+            self.stdout.write(self.style.SUCCESS('Расхождений нет.'))
+            return
+        with transaction.atomic():
+            ShoppingListItem.objects.all().delete()
+            ShoppingListItem.objects.bulk_create(
+                (
+                    ShoppingListItem(
+                        user_id=row['recipe__shopping_cart__user_id'],
+                        ingredient_id=row['ingredient_id'],
+                        total=row['total'],
+                    )
+                    for row in ShoppingListItem.get_totals().iterator()
+                ),
+                batch_size=1000,
+            )
+        self.stdout.write(self.style.SUCCESS('Списки покупок пересобраны.'))
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import FavoriteRecipes, Recipe, ShoppingCart
+from users.models import User
+
+COUNTERS = (
+    (Recipe, 'favorites_count', FavoriteRecipes, 'recipe'),
+    (Recipe, 'shopping_cart_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+)
+
+
+def count_subquery(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(
+                **{field: OuterRef('pk')},
+            ).order_by().values(field).annotate(
+                count=Count('pk'),
+            ).values('count'),
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    """Сверка и исправление денормализованных счётчиков."""
+
+    help = 'Сверка счётчиков избранного, списков покупок и рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, ничего не менять.',
+        )
+
+    def handle(self, *args, **options):
+        for model, field, related_model, related_field in COUNTERS:
+            actual = count_subquery(related_model, related_field)
+            with transaction.atomic():
+                ids = list(
+                    model.objects.annotate(
+                        actual=actual,
+                    ).exclude(
+                        actual=F(field),
+                    ).values_list('pk', flat=True),
+                )
+                if ids and not options['dry_run']:
+                    model.objects.filter(pk__in=ids).update(**{field: actual})
+            self.stdout.write(
+                f'{model._meta.model_name}.{field}: '
+                f'расхождений {len(ids)}',
+            )
+        self.stdout.write(self.style.SUCCESS('Сверка завершена.'))
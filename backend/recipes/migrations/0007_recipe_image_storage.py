@@ -0,0 +1,19 @@
+# Generated by Django 3.2.19 on 2026-10-18 03:51
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(storage=recipes.storage.ContentAddressedStorage(), upload_to='static/recipe/', verbose_name='Фото рецепта'),
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 3.2.19 on 2026-10-18 04:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def fill_feed(apps, schema_editor):
+    """Даты в записях лент и рассылка старых рецептов.
+
+    Рецепты, созданные до ленты, остались с fanned_out=False
+    и без этой рассылки навсегда читались бы при каждом
+    запросе ленты. Повторяет FeedEntry.fan_out_pending.
+    """
+    FeedEntry = apps.get_model('recipes', 'FeedEntry')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Subscribe = apps.get_model('recipes', 'Subscribe')
+    FeedEntry.objects.update(
+        pub_date=models.Subquery(
+            Recipe.objects.filter(
+                pk=models.OuterRef('recipe_id'),
+            ).values('pub_date')[:1],
+        ),
+    )
+    limit = getattr(settings, 'FEED', {}).get('FANOUT_LIMIT', 1000)
+    popular = Subscribe.objects.values('subscriber_id').annotate(
+        followers=models.Count('id'),
+    ).filter(followers__gt=limit).values('subscriber_id')
+    recipes = Recipe.objects.filter(fanned_out=False).exclude(
+        author_id__in=popular,
+    )
+    entries = Subscribe.objects.filter(
+        subscriber__recipes__in=recipes,
+    ).exclude(
+        models.Exists(
+            FeedEntry.objects.filter(
+                user_id=models.OuterRef('user_id'),
+                recipe_id=models.OuterRef('subscriber__recipes__id'),
+            ),
+        ),
+    ).values_list(
+        'user_id',
+        'subscriber__recipes__id',
+        'subscriber__recipes__pub_date',
+    ).order_by()
+    sql, params = entries.query.sql_with_params()
+    schema_editor.execute(
+        f'INSERT INTO {FeedEntry._meta.db_table} '
+        f'(user_id, recipe_id, pub_date) {sql}',
+        params,
+    )
+    recipes.update(fanned_out=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0008_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feedentry',
+            name='pub_date',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата публикации рецепта'),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='feedentry',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', '-pub_date', '-recipe'], name='feed_user_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(('fanned_out', False)), fields=['author', '-pub_date'], name='recipe_pending_fanout_idx'),
+        ),
+        migrations.RunPython(fill_feed, migrations.RunPython.noop),
+    ]
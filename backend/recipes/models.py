@@ -1,6 +1,10 @@
+from django.conf import settings
 from django.core import validators
-from django.db import models
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
 
+from recipes.storage import recipe_image_storage
 from users.models import User
 
 
@@ -63,6 +67,7 @@ class Recipe(models.Model):
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
+        db_index=False,
         related_name='recipes',
         verbose_name='Автор',
     )
@@ -72,6 +77,7 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         upload_to='static/recipe/',
+        storage=recipe_image_storage,
         null=False,
         verbose_name='Фото рецепта',
     )
@@ -113,9 +119,49 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации',
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения',
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число добавлений в избранное',
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число добавлений в список покупок',
+    )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии фото',
+    )
+    fanned_out = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Разослан в ленты подписчиков',
+    )
 
     class Meta:
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_idx',
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx',
+            ),
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='recipe_pending_fanout_idx',
+                condition=models.Q(fanned_out=False),
+            ),
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -127,6 +173,7 @@ class IngredientsInRecipe(models.Model):
     recipe = models.ForeignKey(
         Recipe,
         on_delete=models.CASCADE,
+        db_index=False,
         related_name='ingredients_recipe',
         verbose_name='В каких рецептах',
     )
@@ -148,7 +195,6 @@ class IngredientsInRecipe(models.Model):
     )
 
     class Meta:
-        ordering = ('-id',)
         constraints = [
             models.UniqueConstraint(
                 fields=[
@@ -166,12 +212,14 @@ class FavoriteRecipes(models.Model):
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
+        db_index=False,
         related_name='favorite_recipe',
         verbose_name='Пользователь',
     )
     recipe = models.ForeignKey(
         Recipe,
         on_delete=models.CASCADE,
+        db_index=False,
         related_name='favorite_recipe',
         verbose_name='Избранный рецепт',
     )
@@ -186,6 +234,12 @@ class FavoriteRecipes(models.Model):
                 name='unique_favorite_recipe',
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=['user', 'recipe'],
+                name='favorite_user_recipe_idx',
+            ),
+        ]
         verbose_name = 'Избранный рецепт'
         verbose_name_plural = 'Избранные рецепты'
 
@@ -197,12 +251,14 @@ class ShoppingCart(models.Model):
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
+        db_index=False,
         related_name='shopping_cart',
         verbose_name='Пользователь',
     )
     recipe = models.ForeignKey(
         Recipe,
         on_delete=models.CASCADE,
+        db_index=False,
         related_name='shopping_cart',
         verbose_name='Рецепт',
     )
@@ -217,6 +273,12 @@ class ShoppingCart(models.Model):
                 name='unique_shopping_list_recipe',
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=['user', 'recipe'],
+                name='cart_user_recipe_idx',
+            ),
+        ]
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Списки покупок'
 
@@ -225,22 +287,113 @@ class ShoppingCart(models.Model):
                 f'добавил ингредиенты {self.recipe} в покупки.')
 
 
+class ShoppingListItem(models.Model):
+    """Сводный список покупок пользователя.
+
+    Хранит сумму количества каждого ингредиента по рецептам
+    из списка покупок. Пересчитывается только для затронутых
+    пар пользователь-ингредиент методом refresh.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент',
+    )
+    total = models.PositiveIntegerField(
+        verbose_name='Общее количество',
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=[
+                    'user',
+                    'ingredient',
+                ],
+                name='unique_shopping_list_item',
+            ),
+        ]
+        verbose_name = 'Ингредиент в сводном списке покупок'
+        verbose_name_plural = 'Сводные списки покупок'
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} - {self.total}'
+
+    @classmethod
+    def get_totals(cls, user_ids=None, ingredient_ids=None):
+        # Условия на список покупок - одним filter(), иначе
+        # каждый вызов добавит свой JOIN и суммы умножатся.
+        lookups = {'recipe__shopping_cart__user_id__isnull': False}
+        if user_ids is not None:
+            lookups['recipe__shopping_cart__user_id__in'] = user_ids
+        totals = IngredientsInRecipe.objects.filter(**lookups)
+        if ingredient_ids is not None:
+            totals = totals.filter(ingredient_id__in=ingredient_ids)
+        return totals.values(
+            'recipe__shopping_cart__user_id',
+            'ingredient_id',
+        ).annotate(
+            total=Sum('amount'),
+        ).order_by()
+
+    @classmethod
+    @transaction.atomic
+    def refresh(cls, user_ids, ingredient_ids=None):
+        user_ids = sorted(set(user_ids))
+        if not user_ids:
+            return
+        list(
+            User.objects.select_for_update().filter(
+                id__in=user_ids,
+            ).order_by('id').values_list('id', flat=True),
+        )
+        items = cls.objects.filter(user_id__in=user_ids)
+        if ingredient_ids is not None:
+            items = items.filter(ingredient_id__in=ingredient_ids)
+        items.delete()
+        cls.objects.bulk_create(
+            cls(
+                user_id=row['recipe__shopping_cart__user_id'],
+                ingredient_id=row['ingredient_id'],
+                total=row['total'],
+            )
+            for row in cls.get_totals(user_ids, ingredient_ids)
+        )
+
+    @classmethod
+    def refresh_for_recipe(cls, recipe_id, ingredient_ids=None):
+        cls.refresh(
+            ShoppingCart.objects.filter(
+                recipe_id=recipe_id,
+            ).values_list('user_id', flat=True),
+            ingredient_ids,
+        )
+
+
 class Subscribe(models.Model):
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
+        db_index=False,
         related_name='subscribe',
         verbose_name='Пользователь',
     )
     subscriber = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
+        db_index=False,
         related_name='subscriber',
         verbose_name='Подписчик',
     )
 
     class Meta:
-        ordering = ('-id',)
         constraints = [
             models.UniqueConstraint(
                 fields=[
@@ -250,8 +403,280 @@ class Subscribe(models.Model):
                 name='unique_subscriber',
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=['subscriber', 'user'],
+                name='subscribe_subscriber_user_idx',
+            ),
+        ]
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
 
     def __str__(self):
         return f'Пользователь {self.user} подписался на {self.subscriber}'
+
+
+class DataVersion(models.Model):
+    """Счётчик версий данных для условных GET-запросов.
+
+    Ключ - имя таблицы ('tags', 'ingredients') или
+    пользовательская выборка ('favorites:<id>').
+    Версия увеличивается сигналами при каждом изменении.
+    """
+    key = models.CharField(
+        max_length=100,
+        unique=True,
+        verbose_name='Ключ',
+    )
+    version = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Версия',
+    )
+    updated_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Дата изменения',
+    )
+
+    class Meta:
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
+
+    def __str__(self):
+        return f'{self.key}: {self.version}'
+
+    @classmethod
+    def bump(cls, *keys):
+        now = timezone.now()
+        for key in keys:
+            updated = cls.objects.filter(key=key).update(
+                version=F('version') + 1,
+                updated_at=now,
+            )
+            if updated:
+                continue
+            try:
+                with transaction.atomic():
+                    cls.objects.create(key=key, version=1, updated_at=now)
+            except IntegrityError:
+                cls.objects.filter(key=key).update(
+                    version=F('version') + 1,
+                    updated_at=now,
+                )
+
+    @classmethod
+    def get_versions(cls, keys):
+        return {
+            key: (version, updated_at)
+            for key, version, updated_at in cls.objects.filter(
+                key__in=keys,
+            ).values_list('key', 'version', 'updated_at')
+        }
+
+
+class FeedEntry(models.Model):
+    """Запись ленты подписок пользователя.
+
+    Новый рецепт рассылается в ленты подписчиков автора при
+    создании (fan-out on write), если подписчиков не больше
+    FEED['FANOUT_LIMIT']. Дата публикации копируется в запись,
+    так что страница ленты читается по индексу
+    (user, -pub_date, -recipe) без обхода рецептов. Рецепты
+    популярных авторов остаются с fanned_out=False и
+    переносятся в ленту, когда её читают.
+
+    def fan_out:
+        Разослать новый рецепт подписчикам автора.
+    def fan_out_pending:
+        Разослать все неразосланные рецепты авторов в
+        пределах лимита, например записанные в обход
+        сигналов.
+    def backfill:
+        Последние рецепты автора в ленту нового подписчика.
+    def pull:
+        Перенести в ленту пользователя рецепты популярных
+        авторов, опубликованные после самой новой записи
+        этого автора в ленте. Когда лента догнала авторов,
+        чтение ничего не пишет.
+    def get_feed:
+        Записи ленты пользователя.
+    def get_recipes:
+        Рецепты страницы ленты в порядке её записей.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        db_index=False,
+        related_name='feed_entries',
+        verbose_name='Пользователь',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации рецепта',
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=[
+                    'user',
+                    'recipe',
+                ],
+                name='unique_feed_entry',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_user_pub_date_idx',
+            ),
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
+
+    @classmethod
+    def get_options(cls):
+        return getattr(settings, 'FEED', {})
+
+    @classmethod
+    def get_popular_authors(cls):
+        return Subscribe.objects.values('subscriber_id').annotate(
+            followers=models.Count('id'),
+        ).filter(
+            followers__gt=cls.get_options().get('FANOUT_LIMIT', 1000),
+        ).values('subscriber_id')
+
+    @classmethod
+    def fan_out(cls, recipe):
+        limit = cls.get_options().get('FANOUT_LIMIT', 1000)
+        followers = list(
+            Subscribe.objects.filter(
+                subscriber_id=recipe.author_id,
+            ).values_list('user_id', flat=True).order_by()[:limit + 1],
+        )
+        if len(followers) > limit:
+            return
+        cls.objects.bulk_create(
+            [
+                cls(user_id=user_id, recipe=recipe, pub_date=recipe.pub_date)
+                for user_id in followers
+            ],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+        Recipe.objects.filter(pk=recipe.pk).update(fanned_out=True)
+
+    @classmethod
+    def fan_out_pending(cls):
+        recipes = Recipe.objects.filter(fanned_out=False).exclude(
+            author_id__in=cls.get_popular_authors(),
+        )
+        # INSERT ... SELECT: записей может быть на порядки
+        # больше, чем рецептов, через Python их не гонять.
+        entries = Subscribe.objects.filter(
+            subscriber__recipes__in=recipes,
+        ).exclude(
+            models.Exists(
+                cls.objects.filter(
+                    user_id=models.OuterRef('user_id'),
+                    recipe_id=models.OuterRef('subscriber__recipes__id'),
+                ),
+            ),
+        ).values_list(
+            'user_id',
+            'subscriber__recipes__id',
+            'subscriber__recipes__pub_date',
+        ).order_by()
+        sql, params = entries.query.sql_with_params()
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {cls._meta.db_table} '
+                    f'(user_id, recipe_id, pub_date) {sql}',
+                    params,
+                )
+            recipes.update(fanned_out=True)
+
+    @classmethod
+    def backfill(cls, user_id, author_id):
+        # Все рецепты автора, в том числе неразосланные:
+        # pull потом добирает только то, что новее них.
+        recipes = Recipe.objects.filter(
+            author_id=author_id,
+        ).order_by('-pub_date', '-id').values_list('id', 'pub_date')
+        cls.objects.bulk_create(
+            [
+                cls(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+                for recipe_id, pub_date in recipes[:cls.get_options().get(
+                    'BACKFILL',
+                    50,
+                )]
+            ],
+            ignore_conflicts=True,
+        )
+
+    @classmethod
+    def get_pull_filter(cls, user):
+        pending = Recipe.objects.filter(
+            author_id=models.OuterRef('subscriber_id'),
+            fanned_out=False,
+        )
+        newest = cls.objects.filter(
+            user=user,
+            recipe__author_id=models.OuterRef('subscriber_id'),
+        ).order_by('-pub_date').values('pub_date')[:1]
+        authors = Subscribe.objects.filter(
+            models.Exists(pending),
+            user=user,
+        ).annotate(
+            newest=models.Subquery(newest),
+        ).values_list('subscriber_id', 'newest')
+        condition = models.Q()
+        for author_id, newest in authors:
+            if newest is None:
+                condition |= models.Q(author_id=author_id)
+            else:
+                condition |= models.Q(author_id=author_id, pub_date__gt=newest)
+        return condition
+
+    @classmethod
+    def pull(cls, user):
+        condition = cls.get_pull_filter(user)
+        if not condition:
+            return
+        recipes = Recipe.objects.filter(
+            condition,
+            fanned_out=False,
+        ).order_by('-pub_date', '-id').values_list('id', 'pub_date')
+        entries = [
+            cls(user=user, recipe_id=recipe_id, pub_date=pub_date)
+            for recipe_id, pub_date in recipes[:cls.get_options().get(
+                'BACKFILL',
+                50,
+            )]
+        ]
+        if entries:
+            cls.objects.bulk_create(entries, ignore_conflicts=True)
+
+    @classmethod
+    def get_feed(cls, user):
+        cls.pull(user)
+        return cls.objects.filter(user=user)
+
+    @staticmethod
+    def get_recipes(entries, queryset=None):
+        if queryset is None:
+            queryset = Recipe.objects.all()
+        recipes = queryset.in_bulk([entry.recipe_id for entry in entries])
+        return [
+            recipes[entry.recipe_id]
+            for entry in entries
+            if entry.recipe_id in recipes
+        ]
@@ -0,0 +1,211 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from recipes.images import (delete_orphaned_images, lock_image_files,
+                            schedule_variants)
+from recipes.models import (DataVersion, FavoriteRecipes, FeedEntry,
+                            Ingredient, IngredientsInRecipe, Recipe,
+                            ShoppingCart, ShoppingListItem, Subscribe, Tag)
+from users.models import User
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def bump_tags_version(sender, **kwargs):
+    DataVersion.bump('tags')
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def bump_recipes_version(sender, **kwargs):
+    DataVersion.bump('recipes')
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def bump_ingredients_version(sender, **kwargs):
+    DataVersion.bump('ingredients')
+
+
+@receiver(pre_save, sender=User)
+def remember_list_fields(sender, instance, update_fields=None, **kwargs):
+    # Регистрация, смена пароля, вход по токену и правки
+    # пользователя без рецептов на списки рецептов не влияют.
+    # Удаление автора приходит сигналами удаления рецептов.
+    instance.list_fields_changed = False
+    if instance.pk is None or not instance.recipes_count or (
+        update_fields is not None
+        and not set(update_fields) & set(User.LIST_FIELDS)
+    ):
+        return
+    previous = User.objects.filter(pk=instance.pk).values(
+        *User.LIST_FIELDS,
+    ).first()
+    instance.list_fields_changed = previous is not None and any(
+        previous[field] != getattr(instance, field)
+        for field in User.LIST_FIELDS
+    )
+
+
+@receiver(post_save, sender=User)
+def bump_users_version(sender, instance, **kwargs):
+    if instance.list_fields_changed:
+        DataVersion.bump('users')
+
+
+@receiver((post_save, post_delete), sender=FavoriteRecipes)
+def bump_favorites_version(sender, instance, **kwargs):
+    DataVersion.bump(f'favorites:{instance.user_id}')
+
+
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def bump_shopping_cart_version(sender, instance, **kwargs):
+    DataVersion.bump(f'shopping_cart:{instance.user_id}')
+
+
+@receiver((post_save, post_delete), sender=Subscribe)
+def bump_subscriptions_version(sender, instance, **kwargs):
+    DataVersion.bump(f'subscriptions:{instance.user_id}')
+
+
+def get_recipe_ingredient_ids(recipe_id):
+    return list(
+        IngredientsInRecipe.objects.filter(
+            recipe_id=recipe_id,
+        ).values_list('ingredient_id', flat=True),
+    )
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    if created:
+        ShoppingListItem.refresh(
+            [instance.user_id],
+            get_recipe_ingredient_ids(instance.recipe_id),
+        )
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def collect_shopping_list_ingredients(sender, instance, **kwargs):
+    # После каскадного удаления рецепта его ингредиентов уже нет,
+    # поэтому запоминаем их до удаления.
+    instance.shopping_list_ingredient_ids = get_recipe_ingredient_ids(
+        instance.recipe_id,
+    )
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    ShoppingListItem.refresh(
+        [instance.user_id],
+        getattr(instance, 'shopping_list_ingredient_ids', None),
+    )
+
+
+def change_counter(model, pk, field, delta):
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gt': 0})
+    queryset.update(**{field: F(field) + delta})
+
+
+@receiver(post_save, sender=FavoriteRecipes)
+def increase_favorites_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'favorites_count', 1)
+
+
+@receiver(post_delete, sender=FavoriteRecipes)
+def decrease_favorites_count(sender, instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, 'favorites_count', -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def increase_shopping_cart_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'shopping_cart_count', 1)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def decrease_shopping_cart_count(sender, instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, 'shopping_cart_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def increase_recipes_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def decrease_recipes_count(sender, instance, **kwargs):
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(sender, instance, created, **kwargs):
+    if created:
+        FeedEntry.fan_out(instance)
+
+
+@receiver(post_save, sender=Subscribe)
+def backfill_feed(sender, instance, created, **kwargs):
+    if created:
+        FeedEntry.backfill(instance.user_id, instance.subscriber_id)
+
+
+@receiver(post_delete, sender=Subscribe)
+def clear_feed(sender, instance, **kwargs):
+    FeedEntry.objects.filter(
+        user_id=instance.user_id,
+        recipe__author_id=instance.subscriber_id,
+    ).delete()
+
+
+@receiver(post_save, sender=Recipe)
+def build_image_variants(sender, instance, **kwargs):
+    if instance.image and (
+        instance.image_variants.get('source') != instance.image.name
+    ):
+        transaction.on_commit(lambda: schedule_variants(instance))
+
+
+@receiver(pre_save, sender=Recipe)
+def lock_uploaded_image(sender, instance, **kwargs):
+    # До того как хранилище найдёт уже сохранённый файл:
+    # замок держится до коммита рецепта, сборщик его ждёт.
+    if instance.image and not instance.image._committed:
+        lock_image_files()
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_previous_image(sender, instance, update_fields=None, **kwargs):
+    if instance.pk is None or (
+        update_fields is not None and 'image' not in update_fields
+    ):
+        return
+    instance.previous_image = Recipe.objects.filter(
+        pk=instance.pk,
+    ).values('image', 'image_variants').first()
+
+
+@receiver(post_save, sender=Recipe)
+def delete_replaced_image(sender, instance, **kwargs):
+    previous = getattr(instance, 'previous_image', None)
+    instance.previous_image = None
+    if previous is None or previous['image'] == instance.image.name:
+        return
+    transaction.on_commit(lambda: delete_orphaned_images(
+        instance.image.storage,
+        previous['image'],
+        previous['image_variants'],
+    ))
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_recipe_image(sender, instance, **kwargs):
+    transaction.on_commit(lambda: delete_orphaned_images(
+        instance.image.storage,
+        instance.image.name,
+        instance.image_variants,
+    ))
@@ -0,0 +1,68 @@
+import hashlib
+import os
+import re
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+HASHED_NAME = re.compile(r'^[0-9a-f]{64}$')
+
+
+def get_options():
+    return getattr(settings, 'RECIPE_IMAGE_STORAGE', {})
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, где имя файла - sha256 его содержимого.
+
+    Файл кладётся в каталог из upload_to, разбитый на
+    SHARD_DEPTH уровней по SHARD_WIDTH символов хэша:
+    static/recipe/ab/cd/abcd....png. Повторная загрузка
+    того же содержимого не пишет файл заново, а возвращает
+    уже сохранённое имя, поэтому один файл может принадлежать
+    нескольким рецептам.
+    """
+
+    def get_digest(self, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        return digest.hexdigest()
+
+    def get_hashed_name(self, name, digest):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        width = get_options().get('SHARD_WIDTH', 2)
+        shards = [
+            digest[level * width:(level + 1) * width]
+            for level in range(get_options().get('SHARD_DEPTH', 2))
+        ]
+        return os.path.join(directory, *shards, f'{digest}{extension}')
+
+    def is_hashed(self, name):
+        """Лежит ли файл уже по адресу своего хэша."""
+        directory, filename = os.path.split(name)
+        stem = os.path.splitext(filename)[0]
+        if not HASHED_NAME.match(stem):
+            return False
+        for _ in range(get_options().get('SHARD_DEPTH', 2)):
+            directory = os.path.dirname(directory)
+        return name == self.get_hashed_name(
+            os.path.join(directory, filename),
+            stem,
+        )
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.get_hashed_name(name, self.get_digest(content))
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+
+recipe_image_storage = ContentAddressedStorage()
@@ -30,6 +30,15 @@ class User(AbstractUser):
         max_length=150,
         blank=False,
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Число рецептов',
+        default=0,
+        editable=False,
+    )
+
+    # Поля автора в выдаче рецептов: от них зависят версии
+    # и кэш списков рецептов.
+    LIST_FIELDS = ('email', 'username', 'first_name', 'last_name')
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'first_name', 'last_name', 'password')